@@ -0,0 +1,106 @@
+import array
+import math
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+INT16_MAX = 32767
+INT16_MIN = -32768
+
+PEAK_TARGET = 0.89        # about -1 dBFS
+LOUDNESS_TARGET = -20.0   # dBFS RMS
+SILENCE_THRESHOLD = 300   # int16 amplitude considered silent
+SILENCE_KEEP_MS = 40      # silence kept at each trimmed edge
+
+
+def _samples(pcm: bytes):
+    """Decode little-endian int16 PCM into a numeric sequence."""
+    pcm = pcm[:len(pcm) - len(pcm) % 2]
+    if np is not None:
+        return np.frombuffer(pcm, dtype="<i2")
+    a = array.array("h")
+    a.frombytes(pcm)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+
+def _to_bytes(a) -> bytes:
+    if np is not None:
+        return a.astype("<i2").tobytes()
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+def apply_gain(pcm: bytes, gain: float) -> bytes:
+    """Scale int16 PCM by ``gain``, clipping to the int16 range."""
+    if abs(gain - 1.0) < 0.001:
+        return pcm
+    samples = _samples(pcm)
+    if np is not None:
+        scaled = np.clip(samples.astype(np.float32) * gain, INT16_MIN, INT16_MAX)
+        return _to_bytes(scaled)
+    return _to_bytes(array.array(
+        "h", (max(INT16_MIN, min(INT16_MAX, int(s * gain))) for s in samples)
+    ))
+
+
+def normalize_gain(pcm: bytes, mode: str) -> float:
+    """Gain that brings PCM to the peak or loudness target ("off" returns 1.0)."""
+    samples = _samples(pcm)
+    if mode == "off" or not len(samples):
+        return 1.0
+
+    if np is not None:
+        peak = int(np.max(np.abs(samples.astype(np.int32))))
+    else:
+        peak = max(abs(s) for s in samples)
+    if peak == 0:
+        return 1.0
+    peak_gain = PEAK_TARGET * INT16_MAX / peak
+
+    if mode == "peak":
+        return peak_gain
+
+    if np is not None:
+        rms = float(np.sqrt(np.mean(samples.astype(np.float64) ** 2)))
+    else:
+        rms = math.sqrt(sum(s * s for s in samples) / len(samples))
+    loudness_gain = (10 ** (LOUDNESS_TARGET / 20) * INT16_MAX) / rms
+    # Never push peaks into clipping to reach the loudness target
+    return min(loudness_gain, peak_gain)
+
+
+def trim_silence(pcm: bytes, rate: int, leading: bool = True, trailing: bool = True) -> bytes:
+    """Cut silence at the edges, keeping SILENCE_KEEP_MS of it."""
+    samples = _samples(pcm)
+    if not len(samples) or not (leading or trailing):
+        return pcm
+
+    if np is not None:
+        loud = np.flatnonzero(np.abs(samples.astype(np.int32)) > SILENCE_THRESHOLD)
+        if not len(loud):
+            return b""
+        first, last = int(loud[0]), int(loud[-1])
+    else:
+        loud = [i for i, s in enumerate(samples) if abs(s) > SILENCE_THRESHOLD]
+        if not loud:
+            return b""
+        first, last = loud[0], loud[-1]
+
+    keep = rate * SILENCE_KEEP_MS // 1000
+    start = max(0, first - keep) if leading else 0
+    end = min(len(samples), last + 1 + keep) if trailing else len(samples)
+    return pcm[start * 2:end * 2]
+
+
+def process_pcm(pcm: bytes, rate: int, volume: float = 1.0, normalize: str = "off",
+                trim_leading: bool = False, trim_trailing: bool = False) -> bytes:
+    """Apply silence trimming, normalization and volume to a block of PCM."""
+    if trim_leading or trim_trailing:
+        pcm = trim_silence(pcm, rate, trim_leading, trim_trailing)
+    return apply_gain(pcm, volume * normalize_gain(pcm, normalize))
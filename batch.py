@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Render a JSONL file of speech requests to WAV files in parallel.
+
+Each line is {"text": ..., "out": ...} plus optional voice, speed, noise,
+volume, normalize and trim_silence (defaults come from config.json).
+Outputs whose inputs have not changed since the last run are skipped.
+Rendering is background work: how many groups run at once follows the
+governor's spare-capacity estimate, and synthesis runs niced on a share
+of the CPUs.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from governor import ADJUST_INTERVAL, BACKGROUND, Governor
+from settings import load_settings
+from utils import get_voice_dir, write_wav
+
+GROUP_SIZE = 16   # most records of one voice sent to a worker process at once
+MANIFEST_INTERVAL = 10.0   # seconds between manifest saves during a run
+
+# Per-process engine, so each worker keeps its own warm piper processes
+_engine = None
+
+
+def _init_worker(counter, threads: int):
+    global _engine
+    from engine import PiperEngine
+    _engine = PiperEngine(kind=BACKGROUND)
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    # Give each worker process its own CPUs rather than all starting at the first
+    _engine.governor.next_cpu = index * threads
+    # In-process (onnx) inference runs on this thread and the threads it starts
+    _engine.governor.apply(0, BACKGROUND)
+
+
+def _render_group(records: list[dict]) -> list[tuple]:
+    results = []
+    for rec in records:
+        try:
+            # Batch outputs are files already; skip the shared audio cache
+            pcm, rate = _engine.render(rec["text"], rec, use_cache=False)
+            out_dir = os.path.dirname(rec["out"])
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+            write_wav(rec["out"], pcm, rate)
+            results.append((rec["out"], rec["key"], len(pcm) / 2 / rate, None))
+        except Exception as e:
+            results.append((rec["out"], rec["key"], 0.0, str(e)))
+    return results
+
+
+def record_key(rec: dict) -> str:
+    model_path = os.path.join(get_voice_dir(), f"{rec['voice']}.onnx")
+    try:
+        mtime = os.stat(model_path).st_mtime_ns
+    except OSError:
+        mtime = 0
+    material = [
+        rec["text"], rec["voice"], mtime, rec["speed"], rec["noise"],
+        rec["volume"], rec.get("normalize", "off"), rec.get("trim_silence", False),
+    ]
+    # Same variants as the audio cache; none for piper-tts, so old keys stay valid
+    if rec.get("backend") == "onnx":
+        material.append("onnx-batch" if rec.get("onnx_batch") else "onnx")
+    material = json.dumps(material)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def iter_records(path: Path, defaults: dict):
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"{path}:{lineno}: invalid JSON: {e}")
+                continue
+            if not isinstance(data, dict):
+                print(f"{path}:{lineno}: not a JSON object")
+                continue
+            rec = {**defaults, **data}
+            if not rec.get("text") or not rec.get("out"):
+                print(f"{path}:{lineno}: missing 'text' or 'out'")
+                continue
+            rec["key"] = record_key(rec)
+            yield rec
+
+
+def load_manifest(path: Path) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(path: Path, manifest: dict):
+    tmp = f"{path}.part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def run_batch(path: str, jobs: int | None = None, force: bool = False) -> int:
+    path = Path(path)
+    manifest_path = path.with_name(path.name + ".manifest.json")
+    manifest = {} if force else load_manifest(manifest_path)
+    settings = load_settings()
+    defaults = {k: settings[k] for k in ("voice", "speed", "noise", "volume",
+                                         "normalize", "trim_silence", "cpu_affinity",
+                                         "max_background_synth", "backend", "onnx_batch")}
+    governor = Governor()
+    governor.configure(settings)
+    jobs = jobs or len(governor.cpus)
+    # Split the CPUs between worker processes unless a thread count is set
+    defaults["synth_threads"] = settings.get("synth_threads") or max(1, len(governor.cpus) // jobs)
+
+    done = skipped = failed = 0
+    audio_seconds = 0.0
+    groups: dict[tuple, list] = {}
+    in_flight = set()
+    started = saved = time.monotonic()
+
+    def collect(futures):
+        nonlocal done, failed, audio_seconds, saved
+        for future in futures:
+            governor.release(BACKGROUND)
+            for out, key, seconds, error in future.result():
+                if error:
+                    failed += 1
+                    print(f"{out}: {error}")
+                else:
+                    done += 1
+                    audio_seconds += seconds
+                    manifest[out] = key
+        # Saved as the run goes, so an interrupted run keeps what it finished
+        if futures and time.monotonic() - saved > MANIFEST_INTERVAL:
+            save_manifest(manifest_path, manifest)
+            saved = time.monotonic()
+
+    counter = multiprocessing.Value("i", 0)
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(counter, defaults["synth_threads"])) as pool:
+            def submit(group):
+                nonlocal in_flight
+                # Bound the work held in memory to a couple of groups per worker,
+                # and the work running to what the governor considers spare
+                while len(in_flight) >= jobs * 2 or not governor.acquire(BACKGROUND, block=False):
+                    if not in_flight:
+                        time.sleep(ADJUST_INTERVAL)
+                        continue
+                    finished, in_flight = wait(in_flight, timeout=ADJUST_INTERVAL,
+                                               return_when=FIRST_COMPLETED)
+                    collect(finished)
+                in_flight.add(pool.submit(_render_group, group))
+
+            def idle_worker() -> bool:
+                nonlocal in_flight
+                finished = {f for f in in_flight if f.done()}
+                in_flight -= finished
+                collect(finished)
+                return len(in_flight) < jobs
+
+            for rec in iter_records(path, defaults):
+                if manifest.get(rec["out"]) == rec["key"] and os.path.exists(rec["out"]):
+                    skipped += 1
+                    continue
+                group_key = (rec["voice"], rec["speed"], rec["noise"])
+                group = groups.setdefault(group_key, [])
+                group.append(rec)
+                # A short group beats an idle worker (small files would otherwise
+                # end up in one group on one worker)
+                if len(group) >= GROUP_SIZE or idle_worker():
+                    submit(groups.pop(group_key))
+
+            for group in groups.values():
+                submit(group)
+            collect(wait(in_flight).done)
+    finally:
+        save_manifest(manifest_path, manifest)
+
+    elapsed = time.monotonic() - started
+    print(f"Rendered {done}, skipped {skipped}, failed {failed} in {elapsed:.1f} s")
+    if elapsed > 0:
+        print(f"Throughput: {done / elapsed:.2f} utterances/s, "
+              f"{audio_seconds / elapsed:.2f} audio-seconds per wall-second")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch render a JSONL file with Piper")
+    parser.add_argument("file", help="JSONL file of {text, out, ...} records")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="worker processes (default: CPU count); fewer run while the "
+                             "machine is busy")
+    parser.add_argument("--force", action="store_true", help="re-render up-to-date outputs")
+    args = parser.parse_args()
+    raise SystemExit(run_batch(args.file, args.jobs, args.force))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""Benchmark PiperEngine against stub piper-tts and audio players.
+
+Fake piper-tts, pw-play, paplay, pacat, pw-cli and pactl executables are
+written to a temporary directory placed first on PATH, so results do not
+depend on real voices or audio hardware. The stubs are tuned through
+environment variables (see STUB_DEFAULTS) and the results are written as
+a JSON report that can be compared run over run.
+
+With --parity MODEL it instead renders a few sentences with the real
+piper-tts and with the onnx backend and checks they are identical.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from engine import PiperEngine
+
+SAMPLE_RATE = 22050
+VOICE = "bench"
+
+# Stub behaviour; every value can be overridden from the environment
+STUB_DEFAULTS = {
+    "BENCH_STARTUP": "0.3",        # seconds before piper accepts input (model load)
+    "BENCH_SYNTH_RTF": "0.1",      # wall seconds spent per second of audio produced
+    "BENCH_CHAR_SECONDS": "0.06",  # seconds of audio per input character
+    "BENCH_BACKEND": "pulseaudio", # what the pw-cli stub reports: pipewire or pulseaudio
+}
+
+PLAYERS = ("pw-play", "paplay", "pacat")
+PARITY_TEXTS = (
+    "Hello there.",
+    "The quick brown fox jumps over the lazy dog. Then it ran away!",
+    "Is this the real life? Is this just fantasy?",
+)
+
+_PIPER_STUB = r'''
+import json, math, os, struct, sys, time, wave
+
+args = sys.argv[1:]
+model = args[args.index("--model") + 1]
+with open(model + ".json") as f:
+    rate = json.load(f)["audio"]["sample_rate"]
+startup = float(os.environ["BENCH_STARTUP"])
+rtf = float(os.environ["BENCH_SYNTH_RTF"])
+per_char = float(os.environ["BENCH_CHAR_SECONDS"])
+block = struct.pack("<h", 3000) * (rate // 10)
+
+time.sleep(startup)
+print(f"[piper] [info] Loaded voice in {startup} second(s)", file=sys.stderr, flush=True)
+
+def blocks(text):
+    # 100 ms of audio per block, produced at the configured real-time factor
+    for _ in range(max(1, math.ceil(len(text.strip()) * per_char * 10))):
+        time.sleep(0.1 * rtf)
+        yield block
+
+def write_wav(path, text):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        for b in blocks(text):
+            w.writeframes(b)
+
+if "--json-input" in args:
+    for line in sys.stdin:
+        request = json.loads(line)
+        write_wav(request["output_file"], request["text"])
+        print(request["output_file"], flush=True)
+else:
+    write_wav(args[args.index("--output_file") + 1], sys.stdin.read())
+'''
+
+_PLAYER_STUB = r'''
+import os, re, sys, time
+
+rate = 22050
+for arg in sys.argv[1:]:
+    m = re.match(r"--rate=?(\d+)$", arg)
+    if m:
+        rate = int(m.group(1))
+if "--rate" in sys.argv:
+    rate = int(sys.argv[sys.argv.index("--rate") + 1])
+
+path = sys.argv[-1]
+stream = sys.stdin.buffer if path == "-" or path.startswith("--") else open(path, "rb")
+while data := stream.read(rate // 5):
+    time.sleep(len(data) / 2 / rate)
+'''
+
+_PW_CLI_STUB = r'''
+import os, sys
+sys.exit(0 if os.environ["BENCH_BACKEND"] == "pipewire" else 1)
+'''
+
+_PACTL_STUB = r'''
+import sys, time
+if sys.argv[1:] == ["list", "short", "sinks"]:
+    print("0\tbench_sink\tmodule-null-sink.c\ts16le 2ch 44100Hz\tIDLE")
+elif sys.argv[1:] == ["subscribe"]:
+    while True:
+        time.sleep(3600)
+'''
+
+
+def write_stubs(bin_dir: Path):
+    stubs = {"piper-tts": _PIPER_STUB, "pw-cli": _PW_CLI_STUB, "pactl": _PACTL_STUB}
+    stubs.update({name: _PLAYER_STUB for name in PLAYERS})
+    for name, body in stubs.items():
+        path = bin_dir / name
+        path.write_text(f"#!{sys.executable}\n{body}")
+        path.chmod(0o755)
+
+
+def write_voice(voice_dir: Path):
+    (voice_dir / f"{VOICE}.onnx").write_bytes(b"")
+    config = {"audio": {"sample_rate": SAMPLE_RATE, "quality": "bench"}, "num_speakers": 1}
+    (voice_dir / f"{VOICE}.onnx.json").write_text(json.dumps(config))
+
+
+def descendants(root: int) -> list[tuple[int, str, int]]:
+    """(pid, name, rss bytes) of every process below ``root``."""
+    children: dict[int, list[int]] = {}
+    info: dict[int, tuple[str, int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/status") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue
+        pid = int(entry)
+        rss = int(fields.get("VmRSS", "0 kB").split()[0]) * 1024
+        # Stubs are python scripts, so use the script name from the command line
+        name = fields["Name"].strip()
+        try:
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                argv = f.read().split(b"\0")
+            if len(argv) > 1 and name.startswith("python"):
+                name = os.path.basename(argv[1].decode(errors="replace"))
+        except OSError:
+            pass
+        info[pid] = (name, rss)
+        children.setdefault(int(fields["PPid"]), []).append(pid)
+
+    found, stack = [], list(children.get(root, []))
+    while stack:
+        pid = stack.pop()
+        if pid in info:
+            found.append((pid, *info[pid]))
+        stack.extend(children.get(pid, []))
+    return found
+
+
+def self_rss() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class Sampler:
+    """Samples process count and resident memory of this process tree."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.closed = False
+        self.reset()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def reset(self):
+        with self.lock:
+            self.peak_procs = 0
+            self.peak_players = 0
+            self.peak_rss = 0
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "peak_processes": self.peak_procs,
+                "peak_players": self.peak_players,
+                "peak_rss_mb": round(self.peak_rss / 2**20, 1),
+            }
+
+    def _loop(self):
+        while not self.closed:
+            procs = descendants(os.getpid())
+            players = sum(1 for _, name, _ in procs if name in PLAYERS)
+            rss = self_rss() + sum(r for _, _, r in procs)
+            with self.lock:
+                self.peak_procs = max(self.peak_procs, len(procs))
+                self.peak_players = max(self.peak_players, players)
+                self.peak_rss = max(self.peak_rss, rss)
+            time.sleep(self.interval)
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(values: list[float]) -> dict:
+    ms = [v * 1000 for v in values if v is not None]
+    return {
+        "n": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 1) if ms else None,
+        "p50_ms": round(percentile(ms, 0.5), 1) if ms else None,
+        "p95_ms": round(percentile(ms, 0.95), 1) if ms else None,
+        "max_ms": round(max(ms), 1) if ms else None,
+    }
+
+
+def audio_seconds(engine: PiperEngine) -> float:
+    with engine.metrics.lock:
+        return sum(a for _, a in engine.metrics.rtf.values())
+
+
+def utterance(i: int, words: int) -> str:
+    return f"Benchmark utterance {i}. " + " ".join(["Speech"] * words) + "."
+
+
+def run_jobs(engine: PiperEngine, settings: dict, texts: list[str], interval: float = 0.0,
+             sequential: bool = False) -> dict:
+    started = time.monotonic()
+    audio_before = audio_seconds(engine)
+    jobs = []
+    for text in texts:
+        job = engine.speak(text, settings)
+        jobs.append(job)
+        if sequential:
+            job.wait()
+        elif interval:
+            time.sleep(interval)
+    for job in jobs:
+        job.wait()
+    elapsed = time.monotonic() - started
+    return {
+        "utterances": len(jobs),
+        "failed": sum(1 for j in jobs if j.status != "done"),
+        "elapsed_s": round(elapsed, 3),
+        "utterances_per_s": round(len(jobs) / elapsed, 2),
+        "audio_s_per_s": round((audio_seconds(engine) - audio_before) / elapsed, 2),
+        "time_to_first_audio": summarize([j.timings()["first_audio"] for j in jobs]),
+        "queue_wait": summarize([j.timings()["queue_wait"] for j in jobs]),
+    }
+
+
+def measure_stop(engine: PiperEngine, settings: dict, trials: int, first: int) -> dict:
+    """Stop mid-utterance; time until the job ends and until players exit.
+
+    Utterances are numbered from ``first``.
+    """
+    job_done, players_gone = [], []
+    for i in range(first, first + trials):
+        job = engine.speak(utterance(i, 60), settings)
+        deadline = time.monotonic() + 30
+        while job.first_audio is None and not job.done.is_set() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        t0 = time.monotonic()
+        engine.stop()
+        job.wait()
+        job_done.append(time.monotonic() - t0)
+        while any(name in PLAYERS for _, name, _ in descendants(os.getpid())):
+            if time.monotonic() - t0 > 5:
+                break
+            time.sleep(0.002)
+        players_gone.append(time.monotonic() - t0)
+    return {"job_done": summarize(job_done), "players_gone": summarize(players_gone)}
+
+
+def check_parity(model_path: Path) -> dict:
+    """Render PARITY_TEXTS with the real piper-tts and with the onnx backend
+    (noise 0, so both are deterministic) and compare them sample by sample."""
+    import numpy as np
+
+    from engine import SubprocessBackend
+    from onnx_backend import OnnxBackend
+    from pool import WorkerPool
+
+    backends = (SubprocessBackend(WorkerPool(max_workers=1)), OnnxBackend())
+    texts = []
+    try:
+        for text in PARITY_TEXTS:
+            cli, ours = (np.frombuffer(backend.synthesize_many([text], model_path, 1.0, 0.0)[0][0],
+                                       dtype="<i2").astype(np.int32) for backend in backends)
+            n = min(len(cli), len(ours))
+            texts.append({
+                "text": text,
+                "samples": [len(cli), len(ours)],
+                "max_diff": int(np.max(np.abs(cli[:n] - ours[:n]))) if n else 0,
+            })
+    finally:
+        for backend in backends:
+            backend.close()
+    identical = all(t["samples"][0] == t["samples"][1] and not t["max_diff"] for t in texts)
+    return {"model": str(model_path), "identical": identical, "texts": texts}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_bench(args) -> dict:
+    for key, value in STUB_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+
+    work = Path(tempfile.mkdtemp(prefix="piper_bench_"))
+    bin_dir, voice_dir, cache_dir = work / "bin", work / "voices", work / "cache"
+    for d in (bin_dir, voice_dir):
+        d.mkdir()
+    write_stubs(bin_dir)
+    write_voice(voice_dir)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+
+    settings = {"voice": VOICE, "speed": 1.0, "noise": 0.5, "volume": 1.0}
+    sampler = Sampler()
+    engine = PiperEngine(voice_dir=voice_dir, cache_dir=cache_dir)
+    engine.wait_backend()
+    scenarios = {}
+
+    def scenario(name, fn, *fn_args):
+        print(f"Running {name}...")
+        sampler.reset()
+        result = fn(*fn_args)
+        result.update(sampler.snapshot())
+        scenarios[name] = result
+
+    try:
+        n = args.count
+        # Fresh texts everywhere, so every scenario measures synthesis, not the cache
+        scenario("single", run_jobs, engine, settings,
+                 [utterance(i, args.words) for i in range(n)], 0.0, True)
+        scenario("burst", run_jobs, engine, settings,
+                 [utterance(n + i, args.words) for i in range(n)])
+        count = max(1, int(args.rate * args.duration))
+        scenario("sustained", run_jobs, engine, settings,
+                 [utterance(2 * n + i, args.words) for i in range(count)], 1.0 / args.rate)
+        scenario("stop", measure_stop, engine, settings, args.stop_trials, 2 * n + count)
+    finally:
+        engine.close()
+        sampler.closed = True
+        shutil.rmtree(work, ignore_errors=True)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {**vars(args), **{k: os.environ[k] for k in STUB_DEFAULTS}},
+        "scenarios": scenarios,
+        "max_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "metrics": engine.metrics.snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Piper engine with stub executables")
+    parser.add_argument("-o", "--out", default="bench-report.json", help="JSON report path")
+    parser.add_argument("-n", "--count", type=int, default=10,
+                        help="utterances in the single and burst scenarios")
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="utterances per second in the sustained scenario")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="seconds of sustained submissions")
+    parser.add_argument("--words", type=int, default=12, help="filler words per utterance")
+    parser.add_argument("--stop-trials", type=int, default=5)
+    parser.add_argument("--parity", metavar="MODEL", type=Path,
+                        help="instead, check that the onnx backend matches piper-tts on MODEL")
+    args = parser.parse_args()
+
+    if args.parity:
+        result = check_parity(args.parity)
+        for t in result["texts"]:
+            print(f"{t['text']!r}: samples piper-tts {t['samples'][0]}, onnx {t['samples'][1]}, "
+                  f"max difference {t['max_diff']}")
+        print("identical" if result["identical"] else "DIFFERENT")
+        sys.exit(0 if result["identical"] else 1)
+
+    report = run_bench(args)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in report["scenarios"].items():
+        if "time_to_first_audio" in result:
+            ttfa = result["time_to_first_audio"]
+            print(f"{name}: TTFA p50 {ttfa['p50_ms']} ms, p95 {ttfa['p95_ms']} ms, "
+                  f"{result['utterances_per_s']} utt/s, peak {result['peak_processes']} procs, "
+                  f"{result['peak_rss_mb']} MB")
+        else:
+            print(f"{name}: job done p50 {result['job_done']['p50_ms']} ms, "
+                  f"players gone p50 {result['players_gone']['p50_ms']} ms")
+    print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
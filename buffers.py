@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+from utils import parse_wav
+
+SPILL_BYTES = 32 * 1024 * 1024   # larger renders go to a temp file instead of RAM
+BYTES_PER_CHAR = 8192            # generous estimate: ~0.1 s of 16-bit audio at 44.1 kHz
+
+
+class AudioBuffer:
+    """Private scratch file one synthesis writes its WAV output into.
+
+    Backed by an anonymous memfd that piper opens through /proc, so audio
+    never touches the disk and no two jobs can share a file. Renders
+    expected to exceed ``spill_bytes`` use an unlinked-on-close temporary
+    file instead, as does any system without memfd_create.
+    """
+
+    def __init__(self, expected_bytes: int = 0, spill_bytes: int = SPILL_BYTES):
+        self.spilled = expected_bytes > spill_bytes or not hasattr(os, "memfd_create")
+        if self.spilled:
+            self.fd, self.path = tempfile.mkstemp(prefix="piper_", suffix=".wav")
+        else:
+            self.fd = os.memfd_create("piper_output")
+            self.path = f"/proc/{os.getpid()}/fd/{self.fd}"
+
+    @classmethod
+    def for_text(cls, text: str) -> "AudioBuffer":
+        return cls(len(text) * BYTES_PER_CHAR)
+
+    def read(self) -> tuple[memoryview, int]:
+        """Return (pcm, rate); pcm is a view into a single read of the buffer."""
+        size = os.fstat(self.fd).st_size
+        return parse_wav(os.pread(self.fd, size, 0))
+
+    def close(self):
+        if self.fd is None:
+            return
+        os.close(self.fd)
+        self.fd = None
+        if self.spilled:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from utils import read_wav, write_wav
+
+RESCAN_INTERVAL = 30.0   # seconds between merges of other processes' entries
+
+
+class AudioCache:
+    """Content-addressed store of synthesized audio with LRU eviction.
+
+    Entries are WAV files named after a hash of everything that affects the
+    rendered audio. The directory itself is the index: a file's mtime is
+    its last use (hits touch it), so the least recently used order survives
+    restarts and is shared by every process using the same directory (the
+    app and the daemon). Entries other processes add are merged in by a
+    rescan, at most every RESCAN_INTERVAL seconds, when an entry is added.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.total = 0
+        self.scanned = 0.0
+        self.lock = threading.Lock()
+        with self.lock:
+            self._scan_locked()
+
+    @staticmethod
+    def make_key(text: str, model_path: Path, speed: float, noise: float,
+                 variant: str = "") -> str:
+        normalized = " ".join(text.split())
+        try:
+            mtime = os.stat(model_path).st_mtime_ns
+        except OSError:
+            mtime = 0
+        material = [normalized, Path(model_path).name, mtime, speed, noise]
+        # Left out for piper-tts audio so existing cache entries stay valid
+        if variant:
+            material.append(variant)
+        material = json.dumps(material)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.wav"
+
+    def _scan_locked(self):
+        """Rebuild the entries from the directory, oldest use first."""
+        found = []
+        try:
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if entry.name.endswith(".wav"):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        found.append((st.st_mtime_ns, entry.name[:-4], st.st_size))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Failed to scan audio cache: {e}")
+            return
+        found.sort()
+        self.entries = OrderedDict((key, size) for _, key, size in found)
+        self.total = sum(self.entries.values())
+        self.scanned = time.monotonic()
+
+    def _adopt_locked(self, key: str) -> bool:
+        """Pick up an entry another process wrote since the last scan."""
+        try:
+            size = self._path(key).stat().st_size
+        except OSError:
+            return False
+        self.entries[key] = size
+        self.total += size
+        return True
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock:
+            return key in self.entries or self._adopt_locked(key)
+
+    def get(self, key: str):
+        """Return (pcm, rate) for a cached entry, or None on a miss."""
+        with self.lock:
+            if key not in self.entries and not self._adopt_locked(key):
+                return None
+            self.entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            item = read_wav(path)
+            os.utime(path)   # record the use for LRU order
+            return item
+        except Exception:
+            self.discard(key)
+            return None
+
+    def put(self, key: str, pcm: bytes, rate: int):
+        path = self._path(key)
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            write_wav(path, pcm, rate)
+            size = path.stat().st_size
+        except Exception as e:
+            print(f"Failed to write audio cache entry: {e}")
+            return
+
+        with self.lock:
+            self.total += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            if time.monotonic() - self.scanned > RESCAN_INTERVAL:
+                self._scan_locked()
+            self._evict_locked()
+
+    def discard(self, key: str):
+        with self.lock:
+            self.total -= self.entries.pop(key, 0)
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def _evict_locked(self):
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total -= size
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
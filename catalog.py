@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+DEFAULT_VOICE_DIR = Path(__file__).resolve().parent / "voices"
+DEFAULT_SAMPLE_RATE = 22050
+
+
+class VoiceInfo:
+    """A voice model and the metadata parsed from its .onnx.json file.
+
+    The JSON is only read the first time a metadata field is accessed, so
+    listing a large voices folder stays cheap.
+    """
+
+    def __init__(self, name: str, model_path: Path):
+        self.name = name
+        self.model_path = model_path
+        self.config_path = Path(f"{model_path}.json")
+        try:
+            self.mtime = model_path.stat().st_mtime_ns
+        except OSError:
+            self.mtime = 0
+        self._config: dict | None = None
+
+    @property
+    def config(self) -> dict:
+        if self._config is None:
+            try:
+                with open(self.config_path, "r", encoding="utf-8") as f:
+                    self._config = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._config = {}
+        return self._config
+
+    @property
+    def sample_rate(self) -> int:
+        return int(self.config.get("audio", {}).get("sample_rate", DEFAULT_SAMPLE_RATE))
+
+    @property
+    def quality(self) -> str:
+        return self.config.get("audio", {}).get("quality", "")
+
+    @property
+    def num_speakers(self) -> int:
+        return int(self.config.get("num_speakers", 1))
+
+    @property
+    def language(self) -> str:
+        code = self.config.get("language", {}).get("code", "")
+        return code or self.config.get("espeak", {}).get("voice", "")
+
+    def stale(self) -> bool:
+        try:
+            return self.model_path.stat().st_mtime_ns != self.mtime
+        except OSError:
+            return True
+
+
+class VoiceCatalog:
+    """Index of the voices directory, rebuilt only when the directory changes.
+
+    Each lookup costs one stat() of the directory; metadata of unchanged
+    voices is carried over from the previous index.
+    """
+
+    def __init__(self, voice_dir: Path):
+        self.voice_dir = Path(voice_dir)
+        self.lock = threading.Lock()
+        self.dir_mtime: int | None = None
+        self.voices: dict[str, VoiceInfo] = {}
+        self.order: list[str] = []
+
+    def refresh(self, force: bool = False):
+        try:
+            mtime = self.voice_dir.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+
+        with self.lock:
+            if mtime == self.dir_mtime and not force:
+                return
+            self.dir_mtime = mtime
+
+            voices = {}
+            if mtime is not None:
+                for f in os.listdir(self.voice_dir):
+                    if not f.endswith(".onnx"):
+                        continue
+                    name = f[:-len(".onnx")]
+                    info = self.voices.get(name)
+                    if info is None or info.stale():
+                        info = VoiceInfo(name, self.voice_dir / f)
+                    voices[name] = info
+            self.voices = voices
+            self.order = sorted(voices)
+
+    def names(self) -> list[str]:
+        self.refresh()
+        return list(self.order)
+
+    def get(self, name: str) -> VoiceInfo | None:
+        self.refresh()
+        return self.voices.get(name)
+
+
+_catalogs: dict[Path, VoiceCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(voice_dir=None) -> VoiceCatalog:
+    """Shared catalog per voices directory."""
+    voice_dir = Path(voice_dir or DEFAULT_VOICE_DIR).resolve()
+    with _catalogs_lock:
+        if voice_dir not in _catalogs:
+            _catalogs[voice_dir] = VoiceCatalog(voice_dir)
+        return _catalogs[voice_dir]
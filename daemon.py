@@ -0,0 +1,228 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import PiperEngine, check_outputs
+from scheduler import INTERRUPT, NORMAL
+from settings import load_settings
+from utils import write_wav
+
+# Request fields that override the saved settings for a single request
+SPEECH_KEYS = ("voice", "speed", "noise", "volume", "output_device", "outputs",
+               "normalize", "trim_silence")
+# Numeric request fields: (smallest allowed value, whether it may equal it)
+NUMBER_KEYS = {"speed": (0.0, False), "noise": (0.0, True), "volume": (0.0, True)}
+STRING_KEYS = ("text", "voice", "output_device", "normalize", "out")
+MAX_LINE = 1024 * 1024   # longest request line accepted, in bytes
+
+
+def default_socket_path() -> str:
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "piper-control.sock")
+    return f"/tmp/piper-control-{os.getuid()}.sock"
+
+
+class SpeechDaemon:
+    """Headless JSON-lines server on a Unix socket around one PiperEngine.
+
+    Each line is a request such as {"cmd": "speak", "text": "..."} and gets
+    exactly one JSON line back. Commands: speak, stop, status, render.
+    All clients share the engine's warm workers, cache and speech queue.
+    """
+
+    def __init__(self, engine: PiperEngine, settings: dict, socket_path: str,
+                 concurrency: int = 2, max_queue: int = 32):
+        self.engine = engine
+        self.settings = settings
+        self.socket_path = socket_path
+        self.max_queue = max_queue
+        self.render_slots = asyncio.Semaphore(concurrency)
+        self.render_waiting = 0
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            if _listening(self.socket_path):
+                raise SystemExit(f"Another daemon is listening on {self.socket_path}")
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path,
+                                                 limit=MAX_LINE)
+        os.chmod(self.socket_path, 0o600)
+        print(f"Listening on {self.socket_path}")
+
+        loop = asyncio.get_running_loop()
+        stopped = loop.create_future()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, lambda: stopped.done() or stopped.set_result(None))
+
+        async with server:
+            await stopped
+        os.unlink(self.socket_path)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    line = await self._read_line(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._reply(writer, {
+                        "ok": False, "error": f"request longer than {MAX_LINE} bytes",
+                    })
+                    continue
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                    response = await self._dispatch(request)
+                except Exception as e:
+                    response = {"ok": False, "error": str(e) or type(e).__name__}
+                await self._reply(writer, response)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_line(reader: asyncio.StreamReader) -> bytes:
+        """Next request line. Raises IncompleteReadError at the end of input and
+        LimitOverrunError for a line over MAX_LINE, once it has been skipped."""
+        try:
+            return await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                return e.partial
+            raise
+        except asyncio.LimitOverrunError as overrun:
+            # Discard the line piece by piece; the buffer never exceeds the limit
+            consumed = overrun.consumed
+            while True:
+                await reader.readexactly(consumed)
+                try:
+                    await reader.readuntil(b"\n")
+                except asyncio.LimitOverrunError as e:
+                    consumed = e.consumed
+                    continue
+                raise overrun
+
+    @staticmethod
+    async def _reply(writer: asyncio.StreamWriter, response: dict):
+        writer.write(json.dumps(response).encode("utf-8") + b"\n")
+        await writer.drain()
+
+    def _request_settings(self, request: dict) -> dict:
+        """Settings for one request; malformed fields raise ValueError here,
+        before the request is queued."""
+        for key in STRING_KEYS:
+            if key in request and not isinstance(request[key], str):
+                raise ValueError(f'"{key}" must be a string')
+        for key, (minimum, inclusive) in NUMBER_KEYS.items():
+            if key not in request:
+                continue
+            value = request[key]
+            # Written so that NaN fails too
+            if (isinstance(value, bool) or not isinstance(value, (int, float))
+                    or not (value > minimum or (inclusive and value == minimum))):
+                raise ValueError(f'"{key}" must be a number {">=" if inclusive else ">"} {minimum:g}')
+        overrides = {k: request[k] for k in SPEECH_KEYS if k in request}
+        if "outputs" in overrides:
+            check_outputs(overrides["outputs"])
+        return {**self.settings, **overrides}
+
+    async def _dispatch(self, request: dict) -> dict:
+        cmd = request.get("cmd")
+        if cmd == "speak":
+            return await self._speak(request)
+        if cmd == "render":
+            return await self._render(request)
+        if cmd == "stop":
+            self.engine.stop()
+            return {"ok": True}
+        if cmd == "status":
+            return self._status()
+        return {"ok": False, "error": f"unknown command: {cmd!r}"}
+
+    async def _speak(self, request: dict) -> dict:
+        if len(self.engine.scheduler.jobs()) >= self.max_queue:
+            return {"ok": False, "error": "busy"}
+
+        priority = INTERRUPT if request.get("priority") == "interrupt" else NORMAL
+        job = self.engine.speak(request.get("text", ""), self._request_settings(request), priority)
+
+        if request.get("wait"):
+            loop = asyncio.get_running_loop()
+            finished = loop.create_future()
+            job.add_done_callback(
+                lambda j: loop.call_soon_threadsafe(
+                    lambda: finished.done() or finished.set_result(None)
+                )
+            )
+            await finished
+        return {"ok": True, "job": job.id, "status": job.status,
+                "error": job.error, "timings": job.timings()}
+
+    async def _render(self, request: dict) -> dict:
+        if self.render_waiting >= self.max_queue:
+            return {"ok": False, "error": "busy"}
+
+        text = request.get("text", "")
+        settings = self._request_settings(request)
+        loop = asyncio.get_running_loop()
+        self.render_waiting += 1
+        try:
+            async with self.render_slots:
+                pcm, rate = await loop.run_in_executor(
+                    self.executor, self.engine.render, text, settings
+                )
+        finally:
+            self.render_waiting -= 1
+
+        out = request.get("out")
+        if out:
+            await loop.run_in_executor(self.executor, write_wav, out, pcm, rate)
+        return {"ok": True, "out": out, "seconds": len(pcm) / 2 / rate}
+
+    def _status(self) -> dict:
+        jobs = [
+            {"job": j.id, "status": j.status, "text": j.text[:60]}
+            for j in self.engine.scheduler.jobs()
+        ]
+        return {
+            "ok": True,
+            "jobs": jobs,
+            "workers": len(self.engine.pool.workers),
+            "cache_entries": len(self.engine.cache.entries),
+            "cache_bytes": self.engine.cache.total,
+            "render_waiting": self.render_waiting,
+            "metrics": self.engine.metrics.snapshot(),
+            "governor": self.engine.governor.snapshot(),
+        }
+
+
+def _listening(path: str) -> bool:
+    """True if a server accepts connections on the Unix socket ``path``."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+            return True
+        except OSError:
+            return False
+
+
+def run_daemon(socket_path: str | None = None, concurrency: int = 2, max_queue: int = 32):
+    engine = PiperEngine()
+    daemon = SpeechDaemon(engine, load_settings(), socket_path or default_socket_path(),
+                          concurrency, max_queue)
+    try:
+        asyncio.run(daemon.serve())
+    finally:
+        engine.close()
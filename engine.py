@@ -1,21 +1,125 @@
 import subprocess
-import os
-import shutil
+import queue
 import threading
+import time
 from pathlib import Path
 
+from audio import process_pcm
+from buffers import AudioBuffer
+from cache import AudioCache
+from player import LATENCY_MS, PlaybackGroup
+from pool import Cancelled, WorkerPool
+from prerender import PreRenderer
+from scheduler import NORMAL, SpeechJob, SpeechScheduler
+from segment import split_sentences
+from sinks import SinkRegistry
+from catalog import get_catalog
+from governor import INTERACTIVE, Governor
+from metrics import Metrics, add_span
+
+CHUNK_TIMEOUT = 30    # seconds allowed per chunk
+BACKGROUND_WAIT = 0.5 # share of the first-audio target spent waiting on a background render
+CACHE_MAX_MB = 256
+
+
+def check_outputs(outputs) -> list[dict]:
+    """Validate an "outputs" setting; raises ValueError if it is malformed."""
+    if outputs is None:
+        return []
+    if not isinstance(outputs, list):
+        raise ValueError("outputs must be a list")
+    for output in outputs:
+        if not isinstance(output, dict) or not isinstance(output.get("device", "default"), str):
+            raise ValueError('each output must be an object with a "device" string')
+        gain = output.get("gain", 1.0)
+        if isinstance(gain, bool) or not isinstance(gain, (int, float)) or gain < 0:
+            raise ValueError('output "gain" must be a non-negative number')
+    return outputs
+
+
+class SynthesisBackend:
+    """Turns text into 16-bit mono PCM with one voice.
+
+    Implementations are selected by the "backend" setting: "subprocess"
+    (piper-tts processes) or "onnx" (onnxruntime in this process). ``kind``
+    tells the governor whether the work is interactive or background, and
+    ``variant`` keeps audio that may differ from piper-tts's apart in the cache.
+    """
+
+    name = ""
+    kind = INTERACTIVE
+    variant = ""
+
+    def configure(self, settings):
+        """Pick up backend-specific settings before a request."""
+
+    def synthesize_many(self, texts: list[str], model_path: Path, speed: float, noise: float,
+                        trace: dict | None = None) -> list[tuple[bytes, int]]:
+        """Render each text; returns one (pcm, rate) per text, in order.
+
+        Spawn and model load time go into ``trace``; raises Cancelled when
+        cancel() interrupts it.
+        """
+        raise NotImplementedError
+
+    def cancel(self):
+        """Abort synthesis in progress."""
+
+    def close(self):
+        pass
+
+
+class SubprocessBackend(SynthesisBackend):
+    """Renders through warm piper-tts processes from a WorkerPool."""
+
+    name = "subprocess"
+
+    def __init__(self, pool: WorkerPool):
+        self.pool = pool
+        self.kind = pool.kind
+
+    def synthesize_many(self, texts: list[str], model_path: Path, speed: float, noise: float,
+                        trace: dict | None = None) -> list[tuple[bytes, int]]:
+        results = []
+        for text in texts:
+            with AudioBuffer.for_text(text) as buf:
+                self.pool.synthesize(model_path, speed, noise, text, buf.path,
+                                     timeout=CHUNK_TIMEOUT, trace=trace)
+                results.append(buf.read())
+        return results
+
+    def cancel(self):
+        self.pool.cancel()
+
+    def close(self):
+        self.pool.close()
+
 
 class PiperEngine:
-    def __init__(self):
-        self.voice_dir = Path(__file__).parent / "voices"
-        self.current_process: subprocess.Popen | None = None
-        self.play_process: subprocess.Popen | None = None
+    def __init__(self, backend_hint: str | None = None, voice_dir: Path | None = None,
+                 cache_dir: Path | None = None, kind: str = INTERACTIVE):
+        self.voice_dir = Path(voice_dir or Path(__file__).parent / "voices")
+        self.catalog = get_catalog(self.voice_dir)
+        self.kind = kind
+        self.governor = Governor()
+        self.pool = WorkerPool(governor=self.governor, kind=kind)
+        self.backends: dict[str, SynthesisBackend] = {"subprocess": SubprocessBackend(self.pool)}
+        self.cache = AudioCache(Path(cache_dir or Path(__file__).parent / "cache"),
+                                CACHE_MAX_MB * 1024 * 1024)
+        self.sinks = SinkRegistry()
+        self.player = PlaybackGroup(self._raw_play_cmd)
+        self.sinks.add_listener(self.player.on_sinks_changed)
         self.mute = False
-        self.lock = threading.Lock()
 
-        self.pipewire = self._is_pipewire()
-        self.paplay_cmd = "pw-play" if self.pipewire else "paplay"
-        self.has_sox = shutil.which("sox") is not None
+        # Until probing finishes, trust the backend detected on the last run
+        self._pipewire: bool | None = None if backend_hint is None else backend_hint == "pipewire"
+        self.backend_probed = threading.Event()
+        threading.Thread(target=self._probe_backend, daemon=True).start()
+
+        self.last_first_audio: float | None = None
+        self.metrics = Metrics()
+        self.prerender = PreRenderer(self)
+        self.scheduler = SpeechScheduler(self)
 
     def _is_pipewire(self) -> bool:
         try:
@@ -24,126 +128,318 @@ class PiperEngine:
         except Exception:
             return False
 
+    def _probe_backend(self):
+        self._pipewire = self._is_pipewire()
+        self.backend_probed.set()
+
+    @property
+    def pipewire(self) -> bool:
+        if self._pipewire is None:
+            self.backend_probed.wait()
+        return bool(self._pipewire)
+
+    @property
+    def paplay_cmd(self) -> str:
+        return "pw-play" if self.pipewire else "paplay"
+
+    def wait_backend(self) -> str:
+        """Block until the audio backend probe finishes; returns its name."""
+        self.backend_probed.wait()
+        return "pipewire" if self._pipewire else "pulseaudio"
+
+    def speak(self, text: str, settings: dict, priority: int = NORMAL,
+              dedupe: bool = True) -> SpeechJob:
+        """Queue ``text`` for speaking and return its job handle."""
+        if self.mute or not text.strip():
+            job = SpeechJob(self.scheduler, text, settings)
+            job.status = "cancelled"
+            job.done.set()
+            return job
+        return self.scheduler.submit(text, settings, priority, dedupe)
+
     def stop(self):
-        """Force-stop all synthesis and playback processes."""
-        with self.lock:
-            # Kill synthesis
-            if self.current_process and self.current_process.poll() is None:
-                try:
-                    self.current_process.terminate()
-                    self.current_process.wait(timeout=0.3)
-                except:
-                    self.current_process.kill()
-                    self.current_process.wait(timeout=0.3)
-                self.current_process = None
-
-            # Kill playback
-            if self.play_process and self.play_process.poll() is None:
-                try:
-                    self.play_process.terminate()
-                    self.play_process.wait(timeout=0.3)
-                except:
-                    self.play_process.kill()
-                    self.play_process.wait(timeout=0.3)
-                self.play_process = None
-
-        # Last-resort: kill any lingering piper or pw-play processes by name
-        try:
-            subprocess.run(["pkill", "-9", "-f", "piper-tts"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            subprocess.run(["pkill", "-9", "-f", self.paplay_cmd], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except:
-            pass
+        """Cancel all queued and playing speech; playback goes silent at once."""
+        self.scheduler.cancel_all()
+
+    def close(self):
+        """Shut down warm piper workers."""
+        self.stop()
+        self.prerender.close()
+        for backend in set(self.backends.values()):
+            backend.close()
+        self.player.close()
+        self.sinks.close()
 
     def set_mute(self, state: bool):
         self.mute = state
         if state:
             self.stop()
 
-    def _run(self, text: str, settings: dict):
-        if self.mute or not text.strip():
-            return
+    def backend(self, name: str) -> SynthesisBackend:
+        """The synthesis backend called ``name``, created on first use."""
+        backend = self.backends.get(name)
+        if backend is None:
+            if name == "onnx":
+                try:
+                    from onnx_backend import OnnxBackend
+                    backend = OnnxBackend(governor=self.governor, kind=self.kind)
+                except RuntimeError as e:
+                    print(f"{e}; using piper-tts processes")
+            else:
+                print(f"Unknown synthesis backend {name!r}; using piper-tts processes")
+            # Remember the fallback so the warning is printed once
+            backend = self.backends[name] = backend or self.backends["subprocess"]
+        return backend
 
+    def model_path(self, voice: str) -> Path:
+        info = self.catalog.get(voice)
+        return info.model_path if info else self.voice_dir / f"{voice}.onnx"
+
+    def idle_time(self) -> float:
+        """Seconds since the last foreground request finished (0 while busy)."""
+        return self.scheduler.idle_time()
+
+    def render(self, text: str, settings: dict, use_cache: bool = True) -> tuple[bytes, int]:
+        """Synthesize ``text`` to processed PCM without playing it; returns (pcm, rate)."""
+        plan = self._plan(text, settings)
+        plan["use_cache"] = use_cache
+        chunks = plan["chunks"]
+
+        # Synthesize all missing chunks in one call so backends can batch them
+        missing = [i for i, chunk in enumerate(chunks) if not use_cache
+                   or self._chunk_key(plan, chunk) not in self.cache]
+        rendered = self._synthesize_many(
+            [chunks[i] for i in missing], plan["model_path"], plan["speed"], plan["noise"],
+            plan["backend"],
+        ) if missing else []
+        if use_cache:
+            for i, item in zip(missing, rendered):
+                self.cache.put(self._chunk_key(plan, chunks[i]), *item)
+        rendered = dict(zip(missing, rendered))
+
+        parts = []
+        rate = plan["rate"]
+        for i in range(len(chunks)):
+            pcm, rate = self._chunk_pcm(plan, i, rendered.get(i))
+            parts.append(pcm)
+        return b"".join(parts), rate
+
+    def _prepare(self, job: SpeechJob):
+        """Resolve a job's settings into a synthesis plan (job.plan)."""
+        try:
+            # Checked against the live sink list before any synthesis is paid for
+            outputs = self._outputs(job.settings)
+            job.plan = self._plan(job.text, job.settings)
+            job.plan["outputs"] = outputs
+            job.plan["trace"] = job.trace
+            job.plan["cancel"] = job.cancel_event
+        except FileNotFoundError as e:
+            job.error = str(e)
+            print(job.error)
+
+    def _plan(self, text: str, settings) -> dict:
         voice = settings.get("voice", "en_GB-cori-high")
         speed = settings.get("speed", 1.0)
         noise = settings.get("noise", 0.5)
-        volume = settings.get("volume", 1.0)
-        output_device = settings.get("output_device", "default")
+        info = self.catalog.get(voice)
 
-        model_path = self.voice_dir / f"{voice}.onnx"
-        tmp_wav = Path("/tmp/piper_output.wav")
+        if info is None:
+            raise FileNotFoundError(f"Model file not found: {self.voice_dir / f'{voice}.onnx'}")
+        model_path = info.model_path
 
-        if not model_path.is_file():
-            print(f"Model file not found: {model_path}")
-            return
+        self.cache.max_bytes = int(settings.get("cache_max_mb", CACHE_MAX_MB) * 1024 * 1024)
+        self.governor.configure(settings)
+        backend = self.backend(settings.get("backend", "subprocess"))
+        backend.configure(settings)
+        chunks = split_sentences(text)
 
-        piper_cmd = [
-            "piper-tts",
-            "--model", str(model_path),
-            "--length_scale", str(speed),
-            "--noise_scale", str(noise),
-            "--noise_w", str(noise),
-            "--output_file", str(tmp_wav),
-        ]
+        return {
+            "model_path": model_path,
+            "rate": info.sample_rate,
+            "speed": speed,
+            "noise": noise,
+            "chunks": chunks,
+            "backend": backend,
+            # Set by _prepare(); render() never plays, so never tracks sinks
+            "outputs": None,
+            "volume": settings.get("volume", 1.0),
+            "normalize": settings.get("normalize", "off"),
+            "trim": settings.get("trim_silence", False),
+            "use_cache": True,
+            "trace": None,
+            "cancel": None,
+        }
 
-        try:
-            with self.lock:
-                proc = subprocess.Popen(
-                    piper_cmd,
-                    stdin=subprocess.PIPE,
-                    text=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
-                self.current_process = proc
-
-            stdout, stderr = proc.communicate(input=text, timeout=60)
-
-            if proc.returncode != 0:
-                print(f"Piper failed (exit {proc.returncode}): {stderr.decode().strip()}")
-                return
-
-            if not tmp_wav.is_file():
-                print("No WAV file created!")
-                return
-
-            # Playback
-            if self.has_sox and abs(volume - 1.0) > 0.001:
-                sox_cmd = ["sox", str(tmp_wav), "-t", "wav", "-", "vol", str(volume)]
-                play_cmd = [self.paplay_cmd, "-"]
-
-                if output_device != "default" and not self.pipewire:
-                    play_cmd += ["--device", output_device]
-
-                with self.lock:
-                    sox = subprocess.Popen(sox_cmd, stdout=subprocess.PIPE)
-                    play_proc = subprocess.Popen(play_cmd, stdin=sox.stdout)
-                    sox.stdout.close()
-
-                play_proc.wait()
-                sox.wait()
-            else:
-                cmd = [self.paplay_cmd, str(tmp_wav)]
-                if output_device != "default" and not self.pipewire:
-                    cmd += ["--device", output_device]
+    def _outputs(self, settings) -> list[tuple[str, float]]:
+        """(sink, gain) pairs to play on: "outputs" if set, else "output_device"."""
+        outputs = (check_outputs(settings.get("outputs"))
+                   or [{"device": settings.get("output_device", "default")}])
+        resolved = {}
+        for output in outputs:
+            sink = self.sinks.resolve(output.get("device", "default"))
+            # A sink listed twice (or gone and replaced by default) plays once
+            resolved.setdefault(sink, float(output.get("gain", 1.0)))
+        return list(resolved.items())
 
-                with self.lock:
-                    play_proc = subprocess.Popen(cmd)
-                play_proc.wait()
+    def _render_job(self, job: SpeechJob):
+        """Render stage: synthesize a job's chunks into job.audio."""
+        plan = job.plan
+        if plan is None:
+            return
 
+        try:
+            for i in range(len(plan["chunks"])):
+                if job.cancelled:
+                    return
+                t0 = time.monotonic()
+                item = self._chunk_pcm(plan, i)
+                if i == 0 and plan["backend"].kind == INTERACTIVE:
+                    self.governor.observe_first_audio(time.monotonic() - t0)
+                if not self._put(job, item):
+                    return
+        except Cancelled:
+            pass
         except subprocess.TimeoutExpired:
-            print("Generation or playback timed out")
-            self.stop()
+            job.error = f"Synthesis of a chunk timed out after {CHUNK_TIMEOUT} s"
+            print(job.error)
         except Exception as e:
-            print(f"Playback error: {e}")
-            self.stop()
-
+            job.error = f"Synthesis error: {e}"
+            print(job.error)
         finally:
-            with self.lock:
-                self.current_process = None
-                self.play_process = None
+            self._put(job, None)
 
-            if tmp_wav.exists():
-                try:
-                    tmp_wav.unlink()
-                except:
-                    pass
+    def _play_job(self, job: SpeechJob):
+        """Playback stage: play job.audio in order as chunks arrive."""
+        plan = job.plan
+        if plan is None:
+            return
+
+        try:
+            while (item := self._get(job)) is not None:
+                pcm, rate = item
+                if job.first_audio is None:
+                    self._first_audio(job)
+                self.player.write(pcm, rate, plan["outputs"], job.cancel_event)
+            if job.first_audio is not None:
+                self.player.finish(job.cancel_event)
+
+        except BrokenPipeError:
+            # Stream was aborted by stop()
+            pass
+        except Exception as e:
+            job.error = f"Playback error: {e}"
+            print(job.error)
+            self.player.abort()
+
+    def _chunk_key(self, plan: dict, chunk: str) -> str:
+        return self.cache.make_key(chunk, plan["model_path"], plan["speed"], plan["noise"],
+                                   plan["backend"].variant)
+
+    def _chunk_pcm(self, plan: dict, i: int, item=None) -> tuple[bytes, int]:
+        """Fetch chunk ``i`` from the cache or synthesize it, then post-process.
+
+        ``item`` is the chunk's (pcm, rate) if it was already synthesized.
+        """
+        chunks = plan["chunks"]
+        model_path, speed, noise = plan["model_path"], plan["speed"], plan["noise"]
+        key = self._chunk_key(plan, chunks[i])
+        if item is None and plan["use_cache"]:
+            item = self.cache.get(key)
+            # Background work may be rendering this very chunk (typed ahead),
+            # but at idle priority, so only for a share of the latency budget
+            wait = self.governor.first_audio_target * BACKGROUND_WAIT
+            if item is None and self.prerender.wait_for(key, plan["cancel"], wait):
+                item = self.cache.get(key)
+        if item is None:
+            item = self._synthesize(chunks[i], model_path, speed, noise,
+                                    plan["backend"], plan["trace"])
+            if plan["use_cache"]:
+                self.cache.put(key, *item)
+        pcm, rate = item
+        pcm = process_pcm(
+            pcm, rate, plan["volume"], plan["normalize"],
+            trim_leading=plan["trim"] and i == 0,
+            trim_trailing=plan["trim"] and i == len(chunks) - 1,
+        )
+        return pcm, rate
+
+    def _record(self, job: SpeechJob):
+        """Fold a finished job's timing spans into the metrics registry."""
+        if job.started is None:
+            return
+        trace = {
+            "job": job.id,
+            "voice": job.settings.get("voice"),
+            "status": job.status,
+            "chars": len(job.text),
+            "chunks": len(job.plan["chunks"]) if job.plan else 0,
+            **job.timings(),
+        }
+        if job.first_audio is not None and job.finished is not None:
+            trace["playback"] = job.finished - job.first_audio
+        self.metrics.record(trace, job.settings.get("trace_log") or None)
+
+    def _first_audio(self, job: SpeechJob):
+        job.first_audio = time.monotonic()
+        job.status = "playing"
+        self.last_first_audio = job.first_audio - job.started
+        print(f"First audio after {self.last_first_audio * 1000:.0f} ms")
+
+    def _synthesize(self, text: str, model_path: Path, speed: float, noise: float,
+                    backend: SynthesisBackend | None = None, trace: dict | None = None):
+        """Render one chunk; returns (pcm, rate)."""
+        return self._synthesize_many([text], model_path, speed, noise, backend, trace)[0]
+
+    def _synthesize_many(self, texts: list[str], model_path: Path, speed: float, noise: float,
+                         backend: SynthesisBackend | None = None, trace: dict | None = None):
+        """Render chunks with ``backend`` (default: piper-tts processes).
+
+        Spawn, model load and synthesis time are added to ``trace`` and the
+        voice's real-time factor is updated.
+        """
+        backend = backend or self.backends["subprocess"]
+        spans = {}
+        with self.governor.slot(backend.kind):
+            t0 = time.monotonic()
+            items = backend.synthesize_many(texts, model_path, speed, noise, trace=spans)
+            synthesis = time.monotonic() - t0 - sum(spans.values())
+        audio = sum(len(pcm) / 2 / rate for pcm, rate in items)
+        voice = Path(model_path).stem
+        self.metrics.record_rtf(voice, synthesis, audio)
+        self.governor.observe_rtf(voice, backend.kind, synthesis, audio)
+        for name, seconds in spans.items():
+            add_span(trace, name, seconds)
+        add_span(trace, "synthesis", synthesis)
+        return items
+
+    @staticmethod
+    def _put(job: SpeechJob, item) -> bool:
+        while not job.cancelled:
+            try:
+                job.audio.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    @staticmethod
+    def _get(job: SpeechJob):
+        while not job.cancelled:
+            try:
+                return job.audio.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def _raw_play_cmd(self, rate: int, output_device: str) -> list[str]:
+        if self.pipewire:
+            cmd = [self.paplay_cmd, "--raw", "--rate", str(rate),
+                   "--channels", "1", "--format", "s16", "--latency", f"{LATENCY_MS}ms"]
+            if output_device != "default":
+                cmd.append(f"--target={output_device}")
+            return cmd + ["-"]
+        cmd = ["pacat", "--playback", "--raw", f"--rate={rate}",
+               "--channels=1", "--format=s16le", f"--latency-msec={LATENCY_MS}"]
+        if output_device != "default":
+            cmd.append(f"--device={output_device}")
+        return cmd
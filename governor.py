@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+FIRST_AUDIO_TARGET = 0.5   # seconds allowed to synthesize the first chunk of interactive speech
+ADJUST_INTERVAL = 2.0      # seconds between capacity re-evaluations
+BACKGROUND_NICE = 19
+SLOWDOWN = 1.5             # interactive RTF this many times a voice's best means contention
+MIN_RTF_AUDIO = 0.5        # seconds of audio needed before an RTF sample counts
+
+
+class Governor:
+    """Shares the CPUs between interactive speech and background work.
+
+    Interactive synthesis (speak) always runs right away, on every allowed
+    CPU at normal priority. Background synthesis (pre-render, batch) has to
+    take one of ``limit`` slots, never starts while interactive synthesis is
+    running, and runs niced under SCHED_IDLE on the CPUs the load average
+    says are spare, split between the slots.
+
+    piper-tts cannot be told how many inference threads to use (its
+    onnxruntime pool ignores OMP_NUM_THREADS), so for processes the thread
+    count is enforced as the number of CPUs they are pinned to. The onnx
+    backend gets it as its intra-op thread count instead.
+
+    Every ADJUST_INTERVAL the slot count is revised: halved when the first
+    chunk of interactive speech took longer than ``first_audio_target`` or
+    a voice's interactive real-time factor rose well above its best, and
+    otherwise grown towards the number of spare CPUs.
+    """
+
+    def __init__(self, cpus=None, first_audio_target: float = FIRST_AUDIO_TARGET,
+                 max_background: int = 0, max_threads: int = 0):
+        self.allowed = sorted(os.sched_getaffinity(0))
+        self.cpus = sorted(cpus) if cpus else self.allowed
+        self.first_audio_target = first_audio_target
+        self.max_background = max_background
+        self.max_threads = max_threads
+        self.limit = 1
+        self.background_cpus = self.cpus
+        self.next_cpu = 0   # rotates background processes over the spare CPUs
+        self.running = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.best_rtf: dict[str, float] = {}
+        self.recent_rtf: dict[str, float] = {}
+        self.slowest_first_audio = 0.0
+        self.cond = threading.Condition()
+        self.adjusted = 0.0
+        with self.cond:
+            self._adjust_locked()
+
+    def configure(self, settings):
+        cpus = [c for c in settings.get("cpu_affinity") or [] if c in self.allowed]
+        with self.cond:
+            self.cpus = sorted(cpus) if cpus else self.allowed
+            self.first_audio_target = settings.get("first_audio_target_ms",
+                                                   FIRST_AUDIO_TARGET * 1000) / 1000
+            self.max_background = int(settings.get("max_background_synth", 0))
+            self.max_threads = int(settings.get("synth_threads", 0))
+
+    @property
+    def background_threads(self) -> int:
+        return max(1, len(self.background_cpus) // self.limit)
+
+    def threads(self, kind: str) -> int:
+        """CPUs (or in-process inference threads) one synthesis of ``kind`` may use."""
+        with self.cond:
+            threads = len(self.cpus) if kind == INTERACTIVE else self.background_threads
+            return min(threads, self.max_threads or threads)
+
+    def cpus_for(self, kind: str) -> list[int]:
+        """CPUs to pin a new synthesis process (or thread) of ``kind`` to."""
+        width = self.threads(kind)
+        with self.cond:
+            if kind == INTERACTIVE:
+                return self.cpus[:width]
+            pool = self.background_cpus
+            start = self.next_cpu % len(pool)
+            self.next_cpu = start + width
+            return sorted((pool * 2)[start:start + width])
+
+    def apply(self, pid: int, kind: str):
+        """Pin a process or thread and, for background work, lower its priority.
+
+        Threads it creates afterwards inherit both.
+        """
+        cpus = self.cpus_for(kind)
+        try:
+            if cpus != self.allowed:
+                os.sched_setaffinity(pid, cpus)
+            if kind == BACKGROUND:
+                os.setpriority(os.PRIO_PROCESS, pid, BACKGROUND_NICE)
+                # SCHED_IDLE only runs the process when no one else wants the CPU
+                os.sched_setscheduler(pid, os.SCHED_IDLE, os.sched_param(0))
+        except (AttributeError, OSError):
+            pass
+
+    def acquire(self, kind: str, block: bool = True) -> bool:
+        """Take a synthesis slot. Interactive slots are always granted; background
+        ones wait (or, with ``block`` False, fail) until there is spare capacity."""
+        with self.cond:
+            while kind == BACKGROUND and (self.running[INTERACTIVE]
+                                          or self.running[BACKGROUND] >= self.limit):
+                if not block:
+                    self._adjust_locked()
+                    return False
+                self.cond.wait(0.5)
+                self._adjust_locked()
+            self.running[kind] += 1
+            return True
+
+    def release(self, kind: str):
+        with self.cond:
+            self.running[kind] -= 1
+            self._adjust_locked()
+            self.cond.notify_all()
+
+    @contextmanager
+    def slot(self, kind: str):
+        self.acquire(kind)
+        try:
+            yield
+        finally:
+            self.release(kind)
+
+    def observe_rtf(self, voice: str, kind: str, synth_seconds: float, audio_seconds: float):
+        if audio_seconds < MIN_RTF_AUDIO:
+            return
+        rtf = synth_seconds / audio_seconds
+        with self.cond:
+            self.best_rtf[voice] = min(rtf, self.best_rtf.get(voice, rtf))
+            if kind == INTERACTIVE:
+                self.recent_rtf[voice] = max(rtf, self.recent_rtf.get(voice, 0.0))
+
+    def observe_first_audio(self, seconds: float):
+        """Time the first chunk of an interactive request took to synthesize."""
+        with self.cond:
+            self.slowest_first_audio = max(self.slowest_first_audio, seconds)
+
+    def _contended_locked(self) -> bool:
+        if self.slowest_first_audio > self.first_audio_target:
+            return True
+        return any(rtf > self.best_rtf[voice] * SLOWDOWN
+                   for voice, rtf in self.recent_rtf.items())
+
+    def _adjust_locked(self):
+        now = time.monotonic()
+        if now - self.adjusted < ADJUST_INTERVAL:
+            return
+        self.adjusted = now
+
+        # Load we did not cause ourselves; the 1-minute average lags, so
+        # the slot count also backs off on measured slowdowns below
+        try:
+            load = os.getloadavg()[0]
+        except OSError:
+            load = 0.0
+        ours = self.running[INTERACTIVE] + self.running[BACKGROUND] * self.background_threads
+        spare = max(1, int(len(self.cpus) - max(0.0, load - ours)))
+
+        if self._contended_locked():
+            self.limit = max(1, self.limit // 2)
+        elif self.limit < spare:
+            # Close half the gap, so a batch on an idle machine ramps up quickly
+            self.limit += max(1, (spare - self.limit) // 2)
+        self.limit = min(self.limit, spare, self.max_background or spare)
+        self.background_cpus = self.cpus[-spare:]
+        self.slowest_first_audio = 0.0
+        self.recent_rtf.clear()
+
+    def snapshot(self) -> dict:
+        with self.cond:
+            return {
+                "background_limit": self.limit,
+                "background_threads": self.background_threads,
+                "background_cpus": list(self.background_cpus),
+                "running": dict(self.running),
+            }
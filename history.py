@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import threading
+import time
+
+from settings import PROJECT_ROOT
+
+HISTORY_DB = os.path.join(PROJECT_ROOT, "history.db")
+HISTORY_DEPTH = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS phrases (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE,
+    last_used REAL,           -- NULL once dropped from history
+    uses INTEGER NOT NULL DEFAULT 0,
+    starred REAL              -- NULL unless a favorite
+);
+CREATE INDEX IF NOT EXISTS phrases_last_used ON phrases(last_used);
+CREATE INDEX IF NOT EXISTS phrases_starred ON phrases(starred);
+CREATE VIRTUAL TABLE IF NOT EXISTS phrases_fts USING fts5(
+    text, content='phrases', content_rowid='id', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS phrases_ai AFTER INSERT ON phrases BEGIN
+    INSERT INTO phrases_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS phrases_ad AFTER DELETE ON phrases BEGIN
+    INSERT INTO phrases_fts(phrases_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+class PhraseStore:
+    """Spoken history and favorites in SQLite, with a full-text index.
+
+    Each change touches one row, so saving never rewrites the whole set,
+    and membership checks and searches are index lookups. Phrases that
+    are neither favorites nor among the last ``depth`` spoken are deleted.
+    """
+
+    def __init__(self, path: str = HISTORY_DB, depth: int = HISTORY_DEPTH):
+        self.depth = depth
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+
+    def migrate(self, settings: dict) -> bool:
+        """Move the old "history"/"favorites" lists out of settings; True if any."""
+        history = settings.pop("history", None) or []
+        favorites = settings.pop("favorites", None) or []
+        if not history and not favorites:
+            return False
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute("BEGIN")
+            # Oldest first, so the newest entries end up with the latest timestamps
+            for i, text in enumerate(reversed(history)):
+                self._upsert(text, last_used=now - len(history) + i)
+            for i, text in enumerate(reversed(favorites)):
+                self._upsert(text, starred=now - len(favorites) + i)
+        return True
+
+    def _upsert(self, text: str, last_used: float | None = None, starred: float | None = None):
+        self.db.execute(
+            "INSERT INTO phrases(text, last_used, uses, starred) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(text) DO UPDATE SET "
+            "last_used = COALESCE(excluded.last_used, last_used), "
+            "uses = uses + excluded.uses, "
+            "starred = COALESCE(excluded.starred, starred)",
+            (text, last_used, 1 if last_used else 0, starred),
+        )
+
+    def record(self, text: str):
+        """Add ``text`` to the top of the history."""
+        with self.lock, self.db:
+            self.db.execute("BEGIN")
+            self._upsert(text, last_used=time.time())
+            self._prune()
+
+    def _prune(self):
+        cutoff = self.db.execute(
+            "SELECT last_used FROM phrases WHERE last_used IS NOT NULL "
+            "ORDER BY last_used DESC LIMIT 1 OFFSET ?", (self.depth,)
+        ).fetchone()
+        if cutoff is None:
+            return
+        self.db.execute(
+            "UPDATE phrases SET last_used = NULL WHERE last_used <= ? AND starred IS NOT NULL",
+            cutoff,
+        )
+        self.db.execute("DELETE FROM phrases WHERE last_used <= ? AND starred IS NULL", cutoff)
+
+    def set_favorite(self, text: str, favorite: bool):
+        with self.lock, self.db:
+            self.db.execute("BEGIN")
+            if favorite:
+                self._upsert(text, starred=time.time())
+                return
+            self.db.execute("UPDATE phrases SET starred = NULL WHERE text = ?", (text,))
+            self.db.execute("DELETE FROM phrases WHERE text = ? AND last_used IS NULL", (text,))
+
+    def is_favorite(self, text: str) -> bool:
+        with self.lock:
+            row = self.db.execute("SELECT starred FROM phrases WHERE text = ?", (text,)).fetchone()
+        return bool(row and row[0] is not None)
+
+    def history(self, limit: int | None = None) -> list[str]:
+        """Most recently spoken first."""
+        return self._texts(
+            "SELECT text FROM phrases WHERE last_used IS NOT NULL "
+            "ORDER BY last_used DESC LIMIT ?", (self.depth if limit is None else limit,)
+        )
+
+    def favorites(self, limit: int = -1) -> list[str]:
+        """Most recently starred first."""
+        return self._texts(
+            "SELECT text FROM phrases WHERE starred IS NOT NULL "
+            "ORDER BY starred DESC LIMIT ?", (limit,)
+        )
+
+    def search(self, query: str, favorites: bool, limit: int = -1) -> list[str]:
+        """History or favorites containing every word of ``query`` (as prefixes)."""
+        words = query.split()
+        if not words:
+            return self.favorites(limit) if favorites else self.history(limit)
+        match = " ".join('"{}"*'.format(w.replace('"', '""')) for w in words)
+        column = "starred" if favorites else "last_used"
+        return self._texts(
+            f"SELECT p.text FROM phrases_fts JOIN phrases p ON p.id = phrases_fts.rowid "
+            f"WHERE phrases_fts MATCH ? AND p.{column} IS NOT NULL "
+            f"ORDER BY p.{column} DESC LIMIT ?", (match, limit)
+        )
+
+    def _texts(self, sql: str, params: tuple) -> list[str]:
+        with self.lock:
+            return [row[0] for row in self.db.execute(sql, params)]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
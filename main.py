@@ -1,13 +1,37 @@
 #!/usr/bin/env python3
+import argparse
 import sys
-from ui import PiperUI
+import time
+
+STARTED = time.monotonic()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Piper TTS Control")
+    parser.add_argument("--daemon", action="store_true",
+                        help="run headless, serving JSON requests on a Unix socket")
+    parser.add_argument("--socket", help="socket path for --daemon")
+    parser.add_argument("--concurrency", type=int, default=2,
+                        help="parallel render requests in --daemon mode")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="render a JSONL file of {text, out, ...} records and exit")
+    args, gtk_args = parser.parse_known_args()
+
+    if args.batch:
+        from batch import run_batch
+        sys.exit(run_batch(args.batch))
+
+    if args.daemon:
+        from daemon import run_daemon
+        run_daemon(args.socket, args.concurrency)
+        return
+
+    from ui import PiperUI
+
     print("Starting Piper Control...")
-    app = PiperUI()
+    app = PiperUI(started=STARTED)
     print("Running app...")
-    exit_status = app.run(sys.argv)
+    exit_status = app.run([sys.argv[0], *gtk_args])
     print("App exited with status:", exit_status)
 
 
@@ -0,0 +1,119 @@
+import json
+import math
+import threading
+import time
+
+# Upper bounds in seconds; the last bucket catches everything else
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+
+# Spans recorded for every utterance, in pipeline order
+SPANS = ("queue_wait", "spawn", "model_load", "synthesis", "first_audio", "playback", "stop")
+
+
+def add_span(trace: dict | None, name: str, seconds: float):
+    """Accumulate ``seconds`` under ``name`` in a per-utterance trace dict."""
+    if trace is not None:
+        trace[name] = trace.get(name, 0.0) + seconds
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile: the upper bound of the bucket holding it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": dict(zip(map(str, BUCKETS), self.counts)),
+        }
+
+
+class Metrics:
+    """In-process registry of utterance latency histograms and real-time factors.
+
+    Real-time factor is synthesis time divided by audio duration, tracked
+    per voice (lower is faster; above 1.0 cannot keep up with playback).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms: dict[str, Histogram] = {}
+        self.rtf: dict[str, list[float]] = {}   # voice -> [synth seconds, audio seconds]
+        self.utterances = 0
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            self.histograms.setdefault(name, Histogram()).observe(seconds)
+
+    def record_rtf(self, voice: str, synth_seconds: float, audio_seconds: float):
+        if audio_seconds <= 0:
+            return
+        with self.lock:
+            totals = self.rtf.setdefault(voice, [0.0, 0.0])
+            totals[0] += synth_seconds
+            totals[1] += audio_seconds
+
+    def record(self, trace: dict, trace_log: str | None = None):
+        """Fold one utterance's spans into the histograms, optionally logging it."""
+        with self.lock:
+            self.utterances += 1
+        for name in SPANS:
+            if trace.get(name) is not None:
+                self.observe(name, trace[name])
+        if trace_log:
+            try:
+                with open(trace_log, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"time": time.time(), **trace}) + "\n")
+            except OSError as e:
+                print(f"Failed to write trace log: {e}")
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "utterances": self.utterances,
+                "spans": {name: h.snapshot() for name, h in self.histograms.items()},
+                "rtf": {v: s / a for v, (s, a) in self.rtf.items() if a},
+            }
+
+    def summary(self) -> str:
+        """A few human-readable lines for status displays."""
+        snap = self.snapshot()
+        lines = [f"Utterances: {snap['utterances']}"]
+        for name in SPANS:
+            h = snap["spans"].get(name)
+            if h and h["count"]:
+                lines.append(f"{name}: p50 {h['p50'] * 1000:.0f} ms, "
+                             f"p95 {h['p95'] * 1000:.0f} ms (n={h['count']})")
+        for voice, rtf in sorted(snap["rtf"].items()):
+            lines.append(f"RTF {voice}: {rtf:.2f}")
+        return "\n".join(lines)
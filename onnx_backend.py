@@ -0,0 +1,230 @@
+"""In-process synthesis with onnxruntime, for the "onnx" backend setting.
+
+Needs the optional onnxruntime, numpy and piper_phonemize packages; the
+engine falls back to the piper-tts subprocess backend without them.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+try:
+    import numpy as np
+    import onnxruntime
+    from piper_phonemize import (
+        phoneme_ids_codepoints, phoneme_ids_espeak, phonemize_codepoints, phonemize_espeak,
+    )
+except ImportError:
+    onnxruntime = None
+
+from engine import SynthesisBackend
+from governor import INTERACTIVE
+from metrics import add_span
+from pool import Cancelled
+
+MEMORY_MB = 1024
+SENTENCE_SILENCE = 0.2   # seconds piper-tts appends after every sentence
+
+
+def _to_int16(audio) -> bytes:
+    """Scale float audio to int16 the way piper does (peak-normalized)."""
+    audio = audio.reshape(-1)
+    peak = max(0.01, float(np.max(np.abs(audio)))) if audio.size else 0.01
+    return np.clip(audio * (32767.0 / peak), -32768, 32767).astype("<i2").tobytes()
+
+
+class OnnxVoice:
+    """A loaded voice: inference session plus its phonemizer settings."""
+
+    def __init__(self, model_path: Path, options):
+        with open(f"{model_path}.json", "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.session = onnxruntime.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.rate = int(self.config["audio"]["sample_rate"])
+        self.multi_speaker = self.config.get("num_speakers", 1) > 1
+        # Resident size is dominated by the weights, so the file size is a fair estimate
+        self.cost = os.path.getsize(model_path)
+
+    def phoneme_ids(self, text: str) -> list[list[int]]:
+        """Phoneme ids of each sentence of ``text``, built as piper-tts builds them."""
+        if self.config.get("phoneme_type", "espeak") == "text":
+            language = self.config["language"]["code"]
+            return [phoneme_ids_codepoints(language, s) for s in phonemize_codepoints(text) if s]
+        sentences = phonemize_espeak(text, self.config["espeak"]["voice"])
+        return [phoneme_ids_espeak(s) for s in sentences if s]
+
+
+class OnnxBackend(SynthesisBackend):
+    """Runs piper voices in this process with onnxruntime.
+
+    Sessions stay loaded in least-recently-used order until their combined
+    size exceeds the memory budget. Sentences are synthesized one session
+    run each, from the phoneme ids piper-tts builds and followed by its
+    sentence silence, so the audio is meant to match piper-tts sample for
+    sample at noise 0. That has not been verified against a real piper-tts
+    build yet; ``bench.py --parity`` compares the two on a voice. With
+    ``batch`` enabled, sentences whose phoneme sequences have the same
+    length share one run; the model pads shorter outputs, so batched audio
+    is trimmed at its trailing silence and is no longer bit-identical to
+    the CLI.
+    """
+
+    name = "onnx"
+
+    @property
+    def variant(self) -> str:
+        return "onnx-batch" if self.batch else "onnx"
+
+    def __init__(self, memory_mb: float = MEMORY_MB, intra_threads: int = 0,
+                 inter_threads: int = 0, batch: bool = False, governor=None,
+                 kind: str = INTERACTIVE):
+        if onnxruntime is None:
+            raise RuntimeError("the onnx backend needs onnxruntime, numpy and piper_phonemize")
+        self.governor = governor
+        self.kind = kind
+        self.memory_bytes = int(memory_mb * 1024 * 1024)
+        self.threads = (intra_threads, inter_threads)
+        self.batch = batch
+        self.voices: OrderedDict[str, OnnxVoice] = OrderedDict()
+        self.runs: set = set()
+        self.lock = threading.Lock()
+
+    def configure(self, settings):
+        threads = (int(settings.get("onnx_intra_threads", 0)),
+                   int(settings.get("onnx_inter_threads", 0)))
+        with self.lock:
+            self.memory_bytes = int(settings.get("onnx_memory_mb", MEMORY_MB) * 1024 * 1024)
+            self.batch = bool(settings.get("onnx_batch", False))
+            if threads != self.threads:
+                # Thread counts are fixed per session; reload on next use
+                self.threads = threads
+                self.voices.clear()
+            self._evict_locked()
+
+    def _options(self):
+        options = onnxruntime.SessionOptions()
+        intra, inter = self.threads
+        if not intra and self.governor is not None:
+            # Fixed for the session's lifetime; sessions are reloaded as they are evicted
+            intra = self.governor.threads(self.kind)
+        if intra:
+            options.intra_op_num_threads = intra
+        if inter:
+            options.inter_op_num_threads = inter
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        return options
+
+    def _voice(self, model_path: Path, trace: dict | None) -> OnnxVoice:
+        key = str(model_path)
+        with self.lock:
+            voice = self.voices.get(key)
+            if voice is not None:
+                self.voices.move_to_end(key)
+                return voice
+            options = self._options()
+
+        t0 = time.monotonic()
+        voice = self._load(Path(model_path), options)
+        add_span(trace, "model_load", time.monotonic() - t0)
+        with self.lock:
+            self.voices[key] = voice
+            self._evict_locked()
+        return voice
+
+    def _load(self, model_path: Path, options) -> OnnxVoice:
+        """Load a voice on a thread the governor has pinned (and, for background
+        work, deprioritized); the session's worker threads inherit both."""
+        if self.governor is None:
+            return OnnxVoice(model_path, options)
+        result = {}
+
+        def load():
+            self.governor.apply(0, self.kind)
+            try:
+                result["voice"] = OnnxVoice(model_path, options)
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+        thread.join()
+        if "error" in result:
+            raise result["error"]
+        return result["voice"]
+
+    def _evict_locked(self):
+        total = sum(v.cost for v in self.voices.values())
+        while total > self.memory_bytes and len(self.voices) > 1:
+            _, voice = self.voices.popitem(last=False)
+            total -= voice.cost
+
+    def synthesize_many(self, texts: list[str], model_path: Path, speed: float, noise: float,
+                        trace: dict | None = None) -> list[tuple[bytes, int]]:
+        voice = self._voice(model_path, trace)
+        sentences = [voice.phoneme_ids(text) for text in texts]
+        scales = np.array([noise, speed, noise], dtype=np.float32)
+        silence = bytes(2 * int(SENTENCE_SILENCE * voice.rate))
+
+        # (text index, sentence index) of every sentence, grouped per session run
+        runs: dict = {}
+        for t, ids_list in enumerate(sentences):
+            for s, ids in enumerate(ids_list):
+                group = len(ids) if self.batch else (t, s)
+                runs.setdefault(group, []).append((t, s))
+
+        audio = {}
+        for members in runs.values():
+            ids = [sentences[t][s] for t, s in members]
+            inputs = {
+                "input": np.array(ids, dtype=np.int64),
+                "input_lengths": np.array([len(i) for i in ids], dtype=np.int64),
+                "scales": scales,
+            }
+            if voice.multi_speaker:
+                inputs["sid"] = np.zeros(len(ids), dtype=np.int64)
+            output = self._run(voice, inputs)
+            for member, row in zip(members, output):
+                row = row.reshape(-1)
+                if len(members) > 1:
+                    row = self._trim_padding(row)
+                audio[member] = _to_int16(row) + silence
+
+        return [
+            (b"".join(audio[(t, s)] for s in range(len(ids_list))), voice.rate)
+            for t, ids_list in enumerate(sentences)
+        ]
+
+    @staticmethod
+    def _trim_padding(row):
+        """Drop the near-silent tail the model produces for padded positions."""
+        loud = np.flatnonzero(np.abs(row) > 1e-3 * max(1e-9, float(np.max(np.abs(row)))))
+        return row[:loud[-1] + 1] if len(loud) else row[:0]
+
+    def _run(self, voice: OnnxVoice, inputs: dict):
+        options = onnxruntime.RunOptions()
+        with self.lock:
+            self.runs.add(options)
+        try:
+            return voice.session.run(None, inputs, run_options=options)[0]
+        except Exception:
+            if options.terminate:
+                raise Cancelled()
+            raise
+        finally:
+            with self.lock:
+                self.runs.discard(options)
+
+    def cancel(self):
+        """Terminate session runs in progress; they raise Cancelled."""
+        with self.lock:
+            for options in self.runs:
+                options.terminate = True
+
+    def close(self):
+        self.cancel()
+        with self.lock:
+            self.voices.clear()
@@ -0,0 +1,330 @@
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+
+from audio import apply_gain
+
+LATENCY_MS = 100       # playback buffering requested from the sound server
+LEAD_MS = 20           # silence before audio that follows an idle period
+TAIL_MS = 150          # silence after each utterance, pushes its end out of the buffers
+IDLE_TIMEOUT = 30.0    # seconds without audio before the stream is closed
+ALIGN_TIMEOUT = 0.5    # longest wait for every sink to be ready before starting anyway
+LAG_GRACE = 0.5        # how far a sink may trail the first one to finish before it is dropped
+
+
+def _silence(rate: int, ms: int) -> bytes:
+    return bytes(rate * ms // 1000 * 2)
+
+
+class PlaybackStream:
+    """One long-lived raw player process fed utterance after utterance.
+
+    Opening a stream on the sound server costs a process spawn and can
+    click, so the player stays open between utterances. The stream is
+    reopened when the sink or sample rate changes or the player dies, and
+    is closed after ``idle_timeout`` seconds without audio.
+
+    ``command(rate, sink)`` returns the argv of a raw 16-bit mono player.
+    """
+
+    def __init__(self, command, idle_timeout: float = IDLE_TIMEOUT):
+        self.command = command
+        self.idle_timeout = idle_timeout
+        self.proc: subprocess.Popen | None = None
+        self.sink: str | None = None
+        self.rate: int | None = None
+        self.ends_at = 0.0   # monotonic time at which the audio written so far has played
+        self.lock = threading.Lock()
+        self.timer: threading.Timer | None = None
+
+    def _alive_locked(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def _open_locked(self, rate: int, sink: str):
+        self._kill_locked()
+        self.proc = subprocess.Popen(self.command(rate, sink), stdin=subprocess.PIPE,
+                                     start_new_session=True)
+        self.rate, self.sink = rate, sink
+        self.ends_at = 0.0
+
+    def _kill_locked(self):
+        proc, self.proc = self.proc, None
+        self.ends_at = 0.0
+        if proc is None:
+            return
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        # Reap off the caller's thread; the process exits right away
+        threading.Thread(target=proc.wait, daemon=True).start()
+
+    def _ensure_open_locked(self, rate: int, sink: str):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self._alive_locked() or sink != self.sink or rate != self.rate:
+            self._open_locked(rate, sink)
+
+    def prepare(self, rate: int, sink: str):
+        """Open the stream now, so a following write starts without a spawn."""
+        with self.lock:
+            self._ensure_open_locked(rate, sink)
+
+    def write(self, pcm: bytes, rate: int, sink: str, cancel_event: threading.Event):
+        """Queue ``pcm`` for playback, (re)opening the stream if needed.
+
+        Raises BrokenPipeError if the stream is aborted while writing.
+        """
+        for attempt in range(2):
+            with self.lock:
+                self._ensure_open_locked(rate, sink)
+                proc = self.proc
+                now = time.monotonic()
+                data = pcm
+                if self.ends_at < now:
+                    # The stream ran dry; ease back in rather than starting mid-buffer
+                    data = _silence(rate, LEAD_MS) + data
+                    self.ends_at = now
+                self.ends_at += len(data) / 2 / rate
+            try:
+                proc.stdin.write(data)
+                proc.stdin.flush()
+                return
+            except (BrokenPipeError, ValueError):
+                if cancel_event.is_set() or attempt:
+                    raise BrokenPipeError("playback stream closed")
+                # The player died on its own (sound server restart?); reopen once
+                with self.lock:
+                    if self.proc is proc:
+                        self._kill_locked()
+
+    def finish(self, cancel_event: threading.Event) -> bool:
+        """End an utterance: pad it out and wait until it has been heard.
+
+        Returns False if the player was gone or died, so it was not heard.
+        """
+        with self.lock:
+            if not self._alive_locked():
+                return False
+            proc, rate = self.proc, self.rate
+            played_at = self.ends_at + LATENCY_MS / 1000
+            self.ends_at += TAIL_MS / 1000
+        try:
+            proc.stdin.write(_silence(rate, TAIL_MS))
+            proc.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            return False
+        cancel_event.wait(max(0.0, played_at - time.monotonic()))
+
+        with self.lock:
+            if self.proc is not proc or proc.poll() is not None:
+                return False
+            if self.timer is None:
+                self.timer = threading.Timer(self.idle_timeout, self._close_idle)
+                self.timer.daemon = True
+                self.timer.start()
+        return True
+
+    def _close_idle(self):
+        with self.lock:
+            self.timer = None
+            if self.proc is None or time.monotonic() < self.ends_at:
+                return
+            proc, self.proc = self.proc, None
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        proc.wait()
+
+    def abort(self):
+        """Silence the stream immediately; the next write reopens it."""
+        with self.lock:
+            self._kill_locked()
+
+    def on_sinks_changed(self, added: list[str], removed: list[str]):
+        with self.lock:
+            if self.sink in removed:
+                self._kill_locked()
+
+    def close(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self._kill_locked()
+
+
+class _SinkWriter:
+    """Feeds one sink's PlaybackStream from a queue on its own thread."""
+
+    def __init__(self, stream: PlaybackStream, sink: str):
+        self.stream = stream
+        self.sink = sink
+        self.failed = False
+        self.played = False   # whether the last utterance finished playing
+        self.queue: queue.Queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def _loop(self):
+        while (item := self.queue.get()) is not None:
+            kind, *args = item
+            if kind == "write":
+                self._write(*args)
+            else:
+                cancel_event, done = args
+                self.played = not self.failed and self.stream.finish(cancel_event)
+                self.failed = False
+                done.set()
+
+    def _write(self, pcm: bytes, rate: int, gain: float, cancel_event: threading.Event,
+               barrier: threading.Barrier | None):
+        pcm = apply_gain(pcm, gain)
+        if barrier is not None:
+            # A new utterance: retry a sink that failed or was dropped last time
+            self.failed = False
+            # Open every sink first, then start them together
+            try:
+                self.stream.prepare(rate, self.sink)
+            except OSError as e:
+                self._fail(e)
+            try:
+                barrier.wait(ALIGN_TIMEOUT)
+            except threading.BrokenBarrierError:
+                pass
+        if self.failed or cancel_event.is_set():
+            return
+        try:
+            self.stream.write(pcm, rate, self.sink, cancel_event)
+        except (BrokenPipeError, OSError) as e:
+            if not cancel_event.is_set() and not self.failed:
+                self._fail(e)
+
+    def _fail(self, error: Exception):
+        # Skip this sink for the rest of the utterance; the next one retries it
+        print(f"Output {self.sink} failed: {error}")
+        self.failed = True
+        self.stream.abort()
+
+    def drop(self):
+        """Discard queued audio and silence the sink until the next utterance."""
+        self.failed = True
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[0] == "finish":
+                item[2].set()
+        self.stream.abort()
+
+    def close(self):
+        self.queue.put(None)
+        self.stream.close()
+
+
+class PlaybackGroup:
+    """Plays each utterance on one or more sinks, each with its own gain.
+
+    Every sink has a PlaybackStream per sample rate, so voices with
+    different rates alternate without resampling or reopening a player
+    (an unused one closes after its idle timeout). With a single sink, writes go
+    straight to its stream. With several, each sink is fed by its own
+    thread, so a slow or failed sink never holds up the others, and the
+    first chunk of an utterance waits (up to ALIGN_TIMEOUT) until every
+    stream is open so all sinks start together.
+
+    ``outputs`` is a list of (sink, gain) pairs.
+    """
+
+    def __init__(self, command, idle_timeout: float = IDLE_TIMEOUT):
+        self.command = command
+        self.idle_timeout = idle_timeout
+        self.writers: dict[tuple[str, int], _SinkWriter] = {}
+        self.active: list[_SinkWriter] = []
+        self.started = False
+        self.lock = threading.Lock()
+
+    def _writer(self, sink: str, rate: int) -> _SinkWriter:
+        with self.lock:
+            writer = self.writers.get((sink, rate))
+            if writer is None:
+                writer = _SinkWriter(PlaybackStream(self.command, self.idle_timeout), sink)
+                self.writers[(sink, rate)] = writer
+            return writer
+
+    def write(self, pcm: bytes, rate: int, outputs: list[tuple[str, float]],
+              cancel_event: threading.Event):
+        """Queue ``pcm`` on every sink in ``outputs``.
+
+        Raises BrokenPipeError if playback is aborted while writing.
+        """
+        if len(outputs) == 1:
+            sink, gain = outputs[0]
+            writer = self._writer(sink, rate)
+            self.active = [writer]
+            writer.stream.write(apply_gain(pcm, gain), rate, sink, cancel_event)
+            return
+
+        if cancel_event.is_set():
+            raise BrokenPipeError("playback stream closed")
+        writers = [(self._writer(sink, rate), gain) for sink, gain in outputs]
+        barrier = None
+        if not self.started:
+            barrier = threading.Barrier(len(writers))
+            self.started = True
+        self.active = [writer for writer, _ in writers]
+        for writer, gain in writers:
+            writer.queue.put(("write", pcm, rate, gain, cancel_event, barrier))
+
+    def finish(self, cancel_event: threading.Event):
+        """End an utterance on every sink; waits until the sinks in step have played it."""
+        active, self.active = self.active, []
+        self.started = False
+        if len(active) == 1 and active[0].queue.empty():
+            active[0].stream.finish(cancel_event)
+            return
+
+        pending = {}
+        for writer in active:
+            done = threading.Event()
+            writer.queue.put(("finish", cancel_event, done))
+            pending[writer] = done
+        deadline = None
+        while pending and not cancel_event.is_set():
+            for writer, done in list(pending.items()):
+                if done.is_set():
+                    del pending[writer]
+                    # Sinks that failed finish at once; only a played one sets the pace
+                    if writer.played and deadline is None:
+                        deadline = time.monotonic() + LAG_GRACE
+            if deadline is not None and time.monotonic() > deadline:
+                for writer in pending:
+                    print(f"Output {writer.sink} is falling behind, dropping it")
+                    writer.drop()
+                return
+            cancel_event.wait(0.02)
+
+    def abort(self):
+        """Silence every sink immediately."""
+        with self.lock:
+            writers = list(self.writers.values())
+        self.started = False
+        for writer in writers:
+            writer.drop()
+
+    def on_sinks_changed(self, added: list[str], removed: list[str]):
+        with self.lock:
+            writers = list(self.writers.values())
+        for writer in writers:
+            writer.stream.on_sinks_changed(added, removed)
+
+    def close(self):
+        with self.lock:
+            writers, self.writers = list(self.writers.values()), {}
+        for writer in writers:
+            writer.close()
@@ -0,0 +1,250 @@
+import json
+import os
+import queue
+import re
+import signal
+import subprocess
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+
+from governor import INTERACTIVE
+from metrics import add_span
+
+# piper logs how long loading the model took on stderr
+_LOADED = re.compile(r"Loaded voice in ([\d.]+) second")
+
+
+class Cancelled(Exception):
+    """Raised when a synthesis request is aborted by cancel()."""
+
+    def __str__(self):
+        return "synthesis was cancelled"
+
+
+class WorkerCrashed(Exception):
+    """Raised when a piper process dies while handling a request."""
+
+
+class PiperWorker:
+    """One long-lived piper-tts process fed one JSON utterance per line.
+
+    piper prints the output path on stdout once the WAV file has been
+    written, which is what we wait for to know an utterance is done.
+    """
+
+    def __init__(self, model_path: Path, speed: float, noise: float, governor=None,
+                 kind: str = INTERACTIVE):
+        self.key = (str(model_path), speed, noise)
+        self.governor = governor
+        self.kind = kind
+        self.cmd = [
+            "piper-tts",
+            "--model", str(model_path),
+            "--length_scale", str(speed),
+            "--noise_scale", str(noise),
+            "--noise_w", str(noise),
+            "--json-input",
+        ]
+        self.proc: subprocess.Popen | None = None
+        self.lines: queue.Queue = queue.Queue()
+        self.errors: deque = deque(maxlen=20)
+        self.lock = threading.Lock()
+        self.busy = False
+        self.cancelled = False
+        self.last_used = time.monotonic()
+        self.load_seconds: float | None = None
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        self.load_seconds = None
+        self.proc = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            start_new_session=True,
+        )
+        if self.governor:
+            self.governor.apply(self.proc.pid, self.kind)
+        self.lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self.proc.stdout, self.lines), daemon=True).start()
+        threading.Thread(target=self._drain, args=(self.proc.stderr,), daemon=True).start()
+
+    def _pump(self, stream, lines: queue.Queue):
+        for line in stream:
+            lines.put(line.rstrip("\n"))
+        lines.put(None)
+
+    def _drain(self, stream):
+        for line in stream:
+            m = _LOADED.search(line)
+            if m:
+                self.load_seconds = float(m.group(1))
+            self.errors.append(line.rstrip())
+
+    def synthesize(self, text: str, output_file: Path | str, timeout: float = 60,
+                   trace: dict | None = None):
+        """Render one utterance; spawn and model load time go into ``trace``."""
+        with self.lock:
+            self.busy = True
+            self.cancelled = False
+            spawned = False
+            try:
+                if not self.alive():
+                    t0 = time.monotonic()
+                    self.start()
+                    add_span(trace, "spawn", time.monotonic() - t0)
+                    spawned = True
+                request = json.dumps({"text": text, "output_file": str(output_file)})
+                try:
+                    self.proc.stdin.write(request + "\n")
+                    self.proc.stdin.flush()
+                except (BrokenPipeError, OSError):
+                    if self.cancelled:
+                        raise Cancelled()
+                    raise WorkerCrashed("piper stdin closed")
+
+                deadline = time.monotonic() + timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.kill()
+                        self.proc.wait()
+                        raise subprocess.TimeoutExpired(self.cmd, timeout)
+                    try:
+                        line = self.lines.get(timeout=remaining)
+                    except queue.Empty:
+                        continue
+                    if line is None:
+                        self.proc.wait()
+                        if self.cancelled:
+                            raise Cancelled()
+                        detail = self.errors[-1] if self.errors else ""
+                        raise WorkerCrashed(f"piper exited ({self.proc.poll()}) {detail}".strip())
+                    if line.strip() == str(output_file):
+                        if spawned and self.load_seconds is not None:
+                            add_span(trace, "model_load", self.load_seconds)
+                        return
+            finally:
+                self.busy = False
+                self.last_used = time.monotonic()
+
+    def cancel(self):
+        """Abort the utterance in progress; the worker restarts on next use."""
+        self.cancelled = True
+        self.kill()
+
+    def kill(self):
+        """Signal the worker's process group without waiting for it to exit."""
+        if self.alive():
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+    def close(self):
+        if self.alive():
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=1)
+            except Exception:
+                self.kill()
+
+
+class WorkerPool:
+    """Keeps warm piper workers keyed by (model, speed, noise).
+
+    Least recently used workers are evicted past ``max_workers`` and any
+    worker idle for longer than ``idle_timeout`` seconds is shut down.
+    With a ``governor``, workers are started with the CPU affinity and
+    priority it assigns to work of ``kind``.
+    """
+
+    def __init__(self, max_workers: int = 3, idle_timeout: float = 300.0, governor=None,
+                 kind: str = INTERACTIVE):
+        self.max_workers = max_workers
+        self.idle_timeout = idle_timeout
+        self.governor = governor
+        self.kind = kind
+        self.workers: OrderedDict[tuple, PiperWorker] = OrderedDict()
+        self.lock = threading.Lock()
+        self._reaper: threading.Thread | None = None
+
+    def _checkout(self, model_path: Path, speed: float, noise: float) -> PiperWorker:
+        key = (str(model_path), speed, noise)
+        with self.lock:
+            worker = self.workers.pop(key, None)
+            if worker is None:
+                worker = PiperWorker(model_path, speed, noise, self.governor, self.kind)
+            self.workers[key] = worker
+            evicted = self._evict_locked()
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, daemon=True)
+                self._reaper.start()
+        # Closing waits for the process; never do that holding the lock cancel() needs
+        for old in evicted:
+            old.close()
+        return worker
+
+    def _evict_locked(self) -> list[PiperWorker]:
+        evicted = []
+        for key in list(self.workers):
+            if len(self.workers) <= self.max_workers:
+                break
+            worker = self.workers[key]
+            if not worker.busy:
+                del self.workers[key]
+                evicted.append(worker)
+        return evicted
+
+    def _reap(self):
+        interval = max(1.0, min(30.0, self.idle_timeout / 4))
+        while True:
+            time.sleep(interval)
+            now = time.monotonic()
+            idle = []
+            with self.lock:
+                for key, worker in list(self.workers.items()):
+                    if not worker.busy and now - worker.last_used > self.idle_timeout:
+                        del self.workers[key]
+                        idle.append(worker)
+                done = not self.workers
+                if done:
+                    self._reaper = None
+            for worker in idle:
+                worker.close()
+            if done:
+                return
+
+    def synthesize(self, model_path: Path, speed: float, noise: float,
+                   text: str, output_file: Path | str, timeout: float = 60,
+                   trace: dict | None = None):
+        """Render ``text`` to ``output_file``, restarting a crashed worker once."""
+        worker = self._checkout(model_path, speed, noise)
+        try:
+            worker.synthesize(text, output_file, timeout, trace)
+        except WorkerCrashed as e:
+            print(f"Piper worker crashed, restarting: {e}")
+            worker.synthesize(text, output_file, timeout, trace)
+
+    def cancel(self):
+        """Kill busy workers; used to free the CPU for other work, at the
+        price of a model reload on their next use."""
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            if worker.busy:
+                worker.cancel()
+
+    def close(self):
+        with self.lock:
+            workers = list(self.workers.values())
+            self.workers.clear()
+        for worker in workers:
+            worker.close()
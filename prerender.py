@@ -0,0 +1,192 @@
+import threading
+import time
+
+from governor import BACKGROUND
+from pool import Cancelled, WorkerPool
+from segment import split_sentences
+
+
+class PreRenderer:
+    """Fills the audio cache with phrases we expect to speak again.
+
+    Rendering runs on a separate pool of background piper workers, or with
+    "backend": "onnx" on separately loaded sessions (niced, SCHED_IDLE,
+    limited by the engine's governor either way), so it never takes CPU
+    from a foreground request. Favorites and history
+    only start once the engine has been idle for ``idle_delay`` seconds.
+    Speculative work (the text being typed) starts right away and always
+    goes first.
+    """
+
+    def __init__(self, engine, concurrency: int = 1, idle_delay: float = 2.0):
+        from engine import SubprocessBackend   # engine imports this module
+
+        self.engine = engine
+        self.idle_delay = idle_delay
+        self.pool = WorkerPool(max_workers=concurrency, idle_timeout=60,
+                               governor=engine.governor, kind=BACKGROUND)
+        self.backends = {"subprocess": SubprocessBackend(self.pool)}
+        self.pending: list[tuple] = []
+        self.speculative: list[tuple] = []
+        self.speculative_keys: set[str] = set()
+        self.inflight: dict[str, tuple[threading.Event, bool]] = {}   # key -> (done, speculative)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.threads = [
+            threading.Thread(target=self._loop, daemon=True) for _ in range(concurrency)
+        ]
+        for t in self.threads:
+            t.start()
+
+    def _tasks(self, texts: list[str], settings) -> list[tuple]:
+        """(key, chunk, model_path, speed, noise, backend) for chunks not cached yet."""
+        model_path = self.engine.model_path(settings.get("voice", ""))
+        speed = settings.get("speed", 1.0)
+        noise = settings.get("noise", 0.5)
+        if not model_path.is_file():
+            return []
+        backend = self._backend(settings.get("backend", "subprocess"))
+        backend.configure(settings)
+
+        tasks = []
+        seen = set()
+        for text in texts:
+            for chunk in split_sentences(text):
+                key = self.engine.cache.make_key(chunk, model_path, speed, noise,
+                                                 backend.variant)
+                if key not in seen and key not in self.engine.cache:
+                    seen.add(key)
+                    tasks.append((key, chunk, model_path, speed, noise, backend))
+        return tasks
+
+    def _backend(self, name: str):
+        """Background counterpart of engine.backend(), created on first use."""
+        backend = self.backends.get(name)
+        if backend is None:
+            if name == "onnx":
+                try:
+                    from onnx_backend import OnnxBackend
+                    backend = OnnxBackend(governor=self.engine.governor, kind=BACKGROUND)
+                except RuntimeError:
+                    pass   # the engine reports it when it speaks
+            backend = self.backends[name] = backend or self.backends["subprocess"]
+        return backend
+
+    def _cancel(self):
+        for backend in set(self.backends.values()):
+            backend.cancel()
+
+    def schedule(self, texts: list[str], settings: dict):
+        """Replace the pending work with ``texts`` rendered for ``settings``."""
+        tasks = self._tasks(texts, settings)
+        with self.lock:
+            self.pending = tasks
+        if tasks:
+            self.wakeup.set()
+
+    def speculate(self, text: str, settings: dict):
+        """Render ``text`` ahead of a likely Speak, dropping stale speculation.
+
+        Chunks already rendered stay cached, so editing the end of a text
+        only costs the sentences that changed.
+        """
+        tasks = self._tasks([text], settings) if text.strip() else []
+        keys = {task[0] for task in tasks}
+        with self.lock:
+            self.speculative = tasks
+            self.speculative_keys = keys
+            stale = any(spec and key not in keys for key, (_, spec) in self.inflight.items())
+        if stale:
+            self._cancel()
+        if tasks:
+            self.wakeup.set()
+
+    def preempt(self, text: str | None = None, settings=None):
+        """Abort in-flight background synthesis so a foreground job gets the CPU.
+
+        Work on chunks of ``text`` is kept; the foreground job picks it up
+        through wait_for().
+        """
+        keep = set()
+        if text is not None:
+            keep = {key for key, *_ in self._tasks([text], settings)}
+        with self.lock:
+            needed = all(key in keep for key in self.inflight)
+        if not needed:
+            self._cancel()
+
+    def wait_for(self, key: str, cancel_event: threading.Event | None = None,
+                 timeout: float = 0.25) -> bool:
+        """Wait for an in-flight render of ``key``; True if one finished.
+
+        Background renders run at idle priority and may crawl on a busy
+        machine, so after ``timeout`` seconds they are aborted and the
+        caller synthesizes the chunk itself.
+        """
+        with self.lock:
+            entry = self.inflight.get(key)
+        if entry is None:
+            return False
+        done = entry[0]
+        deadline = time.monotonic() + timeout
+        while not done.wait(0.01):
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            if time.monotonic() > deadline:
+                self._cancel()
+                return False
+        return True
+
+    def _wait_for_idle(self):
+        while not self.speculative:
+            idle_for = self.engine.idle_time()
+            if idle_for >= self.idle_delay:
+                return
+            time.sleep(min(0.25, self.idle_delay - idle_for))
+
+    def _next_task(self) -> tuple[tuple | None, bool]:
+        with self.lock:
+            if self.speculative:
+                return self.speculative.pop(0), True
+            if self.pending:
+                return self.pending.pop(0), False
+            self.wakeup.clear()
+            return None, False
+
+    def _loop(self):
+        while True:
+            self.wakeup.wait()
+            self._wait_for_idle()
+
+            task, speculative = self._next_task()
+            if task is None:
+                continue
+            key, chunk, model_path, speed, noise, backend = task
+            with self.lock:
+                if key in self.engine.cache or key in self.inflight:
+                    continue
+                done = threading.Event()
+                self.inflight[key] = (done, speculative)
+            try:
+                pcm, rate = self.engine._synthesize(chunk, model_path, speed, noise, backend)
+                self.engine.cache.put(key, pcm, rate)
+            except Cancelled:
+                # Pre-empted by a foreground job or stale; retry if still wanted
+                with self.lock:
+                    if not speculative:
+                        self.pending.insert(0, task)
+                    elif key in self.speculative_keys:
+                        self.speculative.insert(0, task)
+            except Exception as e:
+                print(f"Pre-render failed: {e}")
+            finally:
+                with self.lock:
+                    del self.inflight[key]
+                done.set()
+
+    def close(self):
+        with self.lock:
+            self.pending = []
+            self.speculative = []
+        for backend in set(self.backends.values()):
+            backend.close()
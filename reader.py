@@ -0,0 +1,102 @@
+import re
+import threading
+from collections import deque
+
+from segment import MAX_CHUNK, split_sentences
+
+READ_AHEAD = 3          # chunks queued for synthesis/playback ahead of the one playing
+LINE_LIMIT = 64 * 1024  # bytes read at once from lines without a newline
+
+_WORD = re.compile(r"\S+")
+_CONTROL = re.compile(r"\x1b\[[0-9;?]*[ -/]*[@-~]|[\x00-\x08\x0b-\x1f\x7f\ufffd]")
+
+
+def iter_segments(path, offset: int = 0, max_chars: int = MAX_CHUNK):
+    """Yield (chunk, end offset) for the text of ``path`` from byte ``offset``.
+
+    The file is read a line at a time, so memory does not depend on its
+    size. Each end offset is the byte position just after the chunk's last
+    word, which is where reading resumes once the chunk has been heard.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        pos = offset
+        while raw := f.readline(LINE_LIMIT):
+            # surrogateescape keeps invalid bytes, so positions map back exactly
+            line = raw.decode("utf-8", "surrogateescape")
+            words = [m.end() for m in _WORD.finditer(line)]
+            index = 0
+            for chunk in split_sentences(line, max_chars):
+                # Chunks keep every word of the line, in order, joined by single spaces
+                index += chunk.count(" ") + 1
+                end = pos + len(line[:words[index - 1]].encode("utf-8", "surrogateescape"))
+                text = _clean(chunk)
+                if text:
+                    yield text, end
+            pos += len(raw)
+
+
+def _clean(chunk: str) -> str:
+    """Drop terminal escape codes, control characters and undecodable bytes."""
+    chunk = chunk.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
+    return " ".join(_CONTROL.sub(" ", chunk).split())
+
+
+class Reader:
+    """Reads a text file aloud, keeping only a few chunks in flight.
+
+    ``on_progress(path, offset)`` is called from the reader thread after
+    each chunk has played, and with offset None once the file is finished.
+    """
+
+    def __init__(self, engine, read_ahead: int = READ_AHEAD):
+        self.engine = engine
+        self.read_ahead = read_ahead
+        self.stop_event = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    def start(self, path, settings: dict, offset: int = 0, on_progress=None):
+        self.stop()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, args=(path, dict(settings), offset, on_progress, self.stop_event),
+            daemon=True,
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self, path, settings: dict, offset: int, on_progress, stop_event: threading.Event):
+        window: deque = deque()
+        try:
+            segments = iter_segments(path, offset)
+            exhausted = False
+            while not stop_event.is_set():
+                while not exhausted and len(window) < self.read_ahead:
+                    item = next(segments, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    text, end = item
+                    window.append((self.engine.speak(text, settings, dedupe=False), end))
+                if not window:
+                    if on_progress:
+                        on_progress(path, None)
+                    return
+
+                job, end = window[0]
+                while not job.wait(0.2):
+                    if stop_event.is_set():
+                        return
+                if job.status != "done":
+                    # Stopped or failed: keep the offset of the last chunk heard
+                    return
+                window.popleft()
+                if on_progress:
+                    on_progress(path, end)
+        except OSError as e:
+            print(f"Failed to read {path}: {e}")
+        finally:
+            for job, _ in window:
+                job.cancel()
@@ -0,0 +1,248 @@
+import copy
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from types import MappingProxyType
+
+NORMAL = 0
+INTERRUPT = 1   # cancel everything queued or playing and speak now
+
+LOOKAHEAD = 2   # chunks synthesized ahead of playback per job
+
+# Settings that are UI state rather than speech parameters
+_UNSNAPSHOTTED = ("history", "favorites", "reader")
+
+_ids = itertools.count(1)
+
+
+class SpeechJob:
+    """Handle for one queued utterance.
+
+    ``status`` moves from "queued" to "rendering" to "playing" and ends as
+    "done", "cancelled" or "failed". ``settings`` is a frozen snapshot taken
+    at submit time, so later slider changes do not affect the job.
+    ``trace`` collects timing spans (seconds) as the job moves through
+    synthesis and playback.
+    """
+
+    def __init__(self, scheduler, text: str, settings: dict):
+        self.scheduler = scheduler
+        self.id = next(_ids)
+        self.text = text
+        self.settings = MappingProxyType({
+            k: copy.deepcopy(v) for k, v in settings.items() if k not in _UNSNAPSHOTTED
+        })
+        self.status = "queued"
+        self.error: str | None = None
+        self.plan: dict | None = None
+        self.audio: queue.Queue = queue.Queue(maxsize=LOOKAHEAD)
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self.callbacks: list = []
+        self.trace: dict = {}
+
+        self.created = time.monotonic()
+        self.started: float | None = None
+        self.first_audio: float | None = None
+        self.finished: float | None = None
+        self.cancel_requested: float | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.scheduler.cancel(self)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self.done.wait(timeout)
+
+    def add_done_callback(self, fn):
+        """Call ``fn(job)`` once the job finishes; fn must not block."""
+        with self.scheduler.cond:
+            if not self.done.is_set():
+                self.callbacks.append(fn)
+                return
+        fn(self)
+
+    def matches(self, text: str, settings: dict) -> bool:
+        return text == self.text and all(
+            settings.get(k) == v for k, v in self.settings.items()
+        )
+
+    def timings(self) -> dict:
+        """Seconds spent queued, until first audio and in total (None if not reached),
+        plus the spans recorded in ``trace``."""
+        def since_created(t):
+            return None if t is None else t - self.created
+        return {
+            **self.trace,
+            "queue_wait": since_created(self.started),
+            "first_audio": since_created(self.first_audio),
+            "total": since_created(self.finished),
+        }
+
+
+class SpeechScheduler:
+    """Orders speech jobs through a render stage and a playback stage.
+
+    The render thread synthesizes into each job's bounded chunk queue and
+    moves on to the next job as soon as the current one is fully queued,
+    so synthesis of job N+1 overlaps the tail of job N's playback.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.pending: deque[SpeechJob] = deque()
+        self.ready: queue.Queue = queue.Queue()
+        self.queued: deque[SpeechJob] = deque()   # handed to playback, not playing yet
+        self.cond = threading.Condition()
+        self.last: SpeechJob | None = None
+        self.rendering: SpeechJob | None = None
+        self.playing: SpeechJob | None = None
+        self.unfinished = 0
+        self.idle_since = time.monotonic()
+
+        threading.Thread(target=self._render_loop, daemon=True).start()
+        threading.Thread(target=self._play_loop, daemon=True).start()
+
+    def submit(self, text: str, settings: dict, priority: int = NORMAL,
+               dedupe: bool = True) -> SpeechJob:
+        """Queue a job; with ``dedupe``, repeating the last unfinished request returns it."""
+        with self.cond:
+            last = self.last
+            if (dedupe and priority == NORMAL and last is not None and not last.done.is_set()
+                    and not last.cancelled and last.matches(text, settings)):
+                return last
+
+        if priority >= INTERRUPT:
+            self.cancel_all()
+
+        with self.cond:
+            job = SpeechJob(self, text, settings)
+            self.pending.append(job)
+            self.last = job
+            self.unfinished += 1
+            self.cond.notify_all()
+
+        self.engine.prerender.preempt(text, settings)
+        return job
+
+    def cancel(self, job: SpeechJob):
+        with self.cond:
+            self._request_cancel_locked(job)
+            if job in self.pending:
+                self.pending.remove(job)
+                self._finish_locked(job, "cancelled")
+            playing = job is self.playing
+        # Synthesis is left to finish its current chunk (which is cached), so
+        # warm workers survive and other clients' renders are not disturbed;
+        # the render loop drops the job before its next chunk
+        if playing:
+            self.engine.player.abort()
+
+    def cancel_all(self):
+        with self.cond:
+            for job in self.pending:
+                job.cancel_event.set()
+                self._finish_locked(job, "cancelled")
+            self.pending.clear()
+            active = [j for j in (self.rendering, self.playing) if j is not None]
+            playing = self.playing is not None
+            # Jobs waiting for playback are finished by the play loop as it reaches them
+            for job in list(dict.fromkeys(active + list(self.queued))):
+                self._request_cancel_locked(job)
+        if playing:
+            self.engine.player.abort()
+
+    def idle_time(self) -> float:
+        """Seconds since the last job finished (0 while any job is unfinished)."""
+        with self.cond:
+            return 0.0 if self.unfinished else time.monotonic() - self.idle_since
+
+    def jobs(self) -> list[SpeechJob]:
+        with self.cond:
+            active = [j for j in (self.playing, self.rendering) if j is not None]
+            return list(dict.fromkeys(active + list(self.queued) + list(self.pending)))
+
+    def _request_cancel_locked(self, job: SpeechJob):
+        if job.cancel_requested is None:
+            job.cancel_requested = time.monotonic()
+        job.cancel_event.set()
+        try:
+            # Wake a playback stage waiting for the next chunk
+            job.audio.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _finish_locked(self, job: SpeechJob, status: str):
+        if job.done.is_set():
+            return
+        job.status = status
+        job.finished = time.monotonic()
+        if job.cancel_requested is not None and job.started is not None:
+            # Stop latency: from the cancel request until the job wound down
+            job.trace["stop"] = job.finished - job.cancel_requested
+        job.done.set()
+        self.unfinished -= 1
+        if not self.unfinished:
+            self.idle_since = job.finished
+        for fn in job.callbacks:
+            fn(job)
+
+    def _render_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                job = self.pending.popleft()
+                self.rendering = job
+                job.started = time.monotonic()
+                job.status = "rendering"
+
+            try:
+                self.engine._prepare(job)
+            except Exception as e:
+                # The play loop finishes the job as failed; keep rendering others
+                job.error = f"Synthesis error: {e}"
+                print(job.error)
+            with self.cond:
+                self.queued.append(job)
+            self.ready.put(job)
+            try:
+                self.engine._render_job(job)
+            except Exception as e:
+                job.error = f"Synthesis error: {e}"
+                print(job.error)
+            finally:
+                with self.cond:
+                    self.rendering = None
+
+    def _play_loop(self):
+        while True:
+            job = self.ready.get()
+            with self.cond:
+                self.queued.remove(job)
+                if job.cancelled:
+                    self._finish_locked(job, "cancelled")
+                    continue
+                self.playing = job
+
+            try:
+                self.engine._play_job(job)
+            except Exception as e:
+                job.error = str(e)
+                print(f"Playback error: {e}")
+            finally:
+                with self.cond:
+                    self.playing = None
+                    if job.cancelled:
+                        status = "cancelled"
+                    elif job.error:
+                        status = "failed"
+                    else:
+                        status = "done"
+                    self._finish_locked(job, status)
+                self.engine._record(job)
@@ -0,0 +1,52 @@
+import re
+
+MAX_CHUNK = 300
+
+# Sentence ends, optionally followed by a closing quote or bracket
+_SENTENCE_END = re.compile(r"(?:(?<=[.!?…])|(?<=[.!?…][\"'”’)\]]))\s+")
+_CLAUSE_END = re.compile(r"(?<=[,;:—])\s+")
+
+
+def split_sentences(text: str, max_chars: int = MAX_CHUNK) -> list[str]:
+    """Split text into sentence-sized chunks for pipelined synthesis.
+
+    Every line is its own chunk boundary (piper treats lines the same way),
+    and sentences longer than ``max_chars`` are broken at clause punctuation
+    and, failing that, at whitespace.
+    """
+    chunks = []
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if not line:
+            continue
+        for sentence in _SENTENCE_END.split(line):
+            chunks.extend(_split_long(sentence, max_chars))
+    return chunks
+
+
+def _split_long(sentence: str, max_chars: int) -> list[str]:
+    if len(sentence) <= max_chars:
+        return [sentence] if sentence else []
+
+    parts = []
+    for clause in _CLAUSE_END.split(sentence):
+        if len(clause) <= max_chars:
+            parts.append(clause)
+        else:
+            parts.extend(_pack(clause.split(" "), max_chars))
+    return _pack(parts, max_chars)
+
+
+def _pack(pieces: list[str], max_chars: int) -> list[str]:
+    """Greedily join pieces with spaces without exceeding max_chars."""
+    out = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            out.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        out.append(current)
+    return out
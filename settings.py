@@ -1,6 +1,8 @@
 import json
 import os
-from utils import get_voice_dir, list_voices
+import threading
+import time
+from utils import list_voices
 
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(PROJECT_ROOT, "config.json")
@@ -12,6 +14,25 @@ DEFAULTS = {
     "volume": 1.0,
     "mute": False,
     "output_device": "default",
+    "outputs": [],
+    "cache_max_mb": 256,
+    "history_depth": 100,
+    "prerender_history": 3,
+    "prerender_favorites": 50,
+    "speculative": False,
+    "reader": {"path": "", "offset": 0},
+    "normalize": "off",
+    "trim_silence": False,
+    "trace_log": "",
+    "backend": "subprocess",
+    "onnx_memory_mb": 1024,
+    "onnx_intra_threads": 0,
+    "onnx_inter_threads": 0,
+    "onnx_batch": False,
+    "cpu_affinity": [],
+    "synth_threads": 0,
+    "max_background_synth": 0,
+    "first_audio_target_ms": 500,
 }
 
 def load_settings():
@@ -23,8 +44,7 @@ def load_settings():
         except Exception as e:
             print(f"Failed to load {CONFIG_PATH}: {e}")
 
-    voice_dir = get_voice_dir()
-    available_voices = list_voices(voice_dir)
+    available_voices = list_voices()
     default_voice = available_voices[0] if available_voices else "en_GB-cori-high"
     DEFAULTS["voice"] = default_voice
 
@@ -35,12 +55,69 @@ def load_settings():
 
     return settings
 
-def save_settings(settings):
+
+def _write_config(data: str) -> bool:
+    """Write config.json atomically: temp file, fsync, then rename over it."""
+    tmp = f"{CONFIG_PATH}.tmp"
     try:
         os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
-        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-            json.dump(settings, f, indent=2)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, CONFIG_PATH)
         return True
     except Exception as e:
         print(f"Failed to save settings: {e}")
         return False
+
+
+class SettingsStore:
+    """Coalesces settings saves and writes them on a background thread.
+
+    save() only serializes a snapshot; the write happens once changes have
+    been quiet for ``delay`` seconds (or at most ``max_wait`` after the
+    first unsaved change). flush() writes any pending snapshot right away.
+    """
+
+    def __init__(self, settings: dict, delay: float = 0.5, max_wait: float = 2.0):
+        self.settings = settings
+        self.delay = delay
+        self.max_wait = max_wait
+        self.pending: str | None = None
+        self.first_change = 0.0
+        self.last_change = 0.0
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def save(self):
+        data = json.dumps(self.settings, indent=2)
+        now = time.monotonic()
+        with self.cond:
+            if self.pending is None:
+                self.first_change = now
+            self.pending = data
+            self.last_change = now
+            self.cond.notify()
+
+    def flush(self):
+        with self.write_lock:
+            with self.cond:
+                data, self.pending = self.pending, None
+            if data is not None:
+                _write_config(data)
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                while self.pending is not None:
+                    deadline = min(self.last_change + self.delay,
+                                   self.first_change + self.max_wait)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+            self.flush()
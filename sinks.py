@@ -0,0 +1,113 @@
+import re
+import subprocess
+import threading
+import time
+
+from utils import list_sinks_by_index
+
+_EVENT = re.compile(r"Event '(\w+)' on sink #(\d+)")
+
+
+class SinkRegistry:
+    """In-memory list of audio sinks kept current by one `pactl subscribe`.
+
+    Sinks are enumerated once, then "new"/"remove" events update the
+    registry as a stream: removals need no pactl call at all and an
+    addition costs one listing per event, never one per speech request.
+    Listeners are called as ``fn(added, removed)`` with lists of sink names.
+    """
+
+    def __init__(self):
+        self.by_index: dict[int, str] = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.listeners: list = []
+        self.proc: subprocess.Popen | None = None
+        self.closed = False
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        with self.lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def add_listener(self, fn):
+        self.listeners.append(fn)
+
+    def names(self) -> list[str]:
+        with self.lock:
+            return ["default", *self.by_index.values()]
+
+    def has(self, name: str) -> bool:
+        with self.lock:
+            return name == "default" or name in self.by_index.values()
+
+    def resolve(self, name: str) -> str:
+        """Return ``name`` if the sink exists (or is unknown yet), else "default"."""
+        self.start()
+        if not self.ready.is_set() or self.has(name):
+            return name
+        print(f"Output device {name} is gone, using default")
+        return "default"
+
+    def _run(self):
+        backoff = 1.0
+        while not self.closed:
+            try:
+                self._resync()
+                self.ready.set()
+                started = time.monotonic()
+                self._subscribe()
+                if time.monotonic() - started > 60:
+                    backoff = 1.0
+            except Exception as e:
+                print(f"Sink tracking failed: {e}")
+                self.ready.set()
+            # pactl exited (sound server restart?); resync and resubscribe
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def _subscribe(self):
+        self.proc = subprocess.Popen(
+            ["pactl", "subscribe"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        for line in self.proc.stdout:
+            m = _EVENT.search(line)
+            if not m:
+                continue
+            event, index = m.group(1), int(m.group(2))
+            if event == "new":
+                self._resync()
+            elif event == "remove":
+                with self.lock:
+                    name = self.by_index.pop(index, None)
+                if name is not None:
+                    self._notify([], [name])
+        self.proc.wait()
+
+    def _resync(self):
+        current = list_sinks_by_index()
+        with self.lock:
+            old = set(self.by_index.values())
+            self.by_index = current
+        new = set(current.values())
+        added = [n for n in current.values() if n not in old]
+        removed = [n for n in old if n not in new]
+        if added or removed:
+            self._notify(added, removed)
+
+    def _notify(self, added: list[str], removed: list[str]):
+        for fn in self.listeners:
+            try:
+                fn(added, removed)
+            except Exception as e:
+                print(f"Sink listener failed: {e}")
+
+    def close(self):
+        self.closed = True
+        if self.proc and self.proc.poll() is None:
+            self.proc.kill()
@@ -1,25 +1,42 @@
 import gi
 gi.require_version("Gtk", "4.0")
-from gi.repository import Gtk, Pango, Gdk
+from gi.repository import Gtk, Pango, Gdk, GLib
 
+import os
 import threading
+import time
 from typing import Dict, Any, List
 
 from engine import PiperEngine
-from settings import load_settings, save_settings
-from utils import list_voices, list_audio_sinks
+from history import HISTORY_DEPTH, PhraseStore
+from reader import Reader
+from scheduler import INTERRUPT, NORMAL
+from settings import SettingsStore, load_settings
+from utils import list_voices
+
+SPECULATE_DELAY_MS = 600   # typing pause before speculative synthesis starts
+PRERENDER_DELAY_MS = 400   # slider pause before pre-rendering is rescheduled
 
 
 class PiperUI(Gtk.Application):
-    def __init__(self):
+    def __init__(self, started: float | None = None):
         super().__init__(application_id="local.piper.control.portable")
+        self.started = started or time.monotonic()
         self.settings: Dict[str, Any] = load_settings()
-        self.engine = PiperEngine()
-        self.tts_thread: threading.Thread | None = None
+        self.store = SettingsStore(self.settings)
+        self.engine = PiperEngine(backend_hint=self.settings.get("audio_backend"))
+        self.reader = Reader(self.engine)
+        self.file_dialog = None
         self.sink_map: Dict[str, str] = {}
+        self.sink_names: List[str] = []
+        self.speculate_source: int | None = None
+        self.prerender_source: int | None = None
+
+        self.phrases = PhraseStore(depth=self.settings.get("history_depth", HISTORY_DEPTH))
+        if self.phrases.migrate(self.settings):
+            self.store.save()
 
-        self.history: List[str] = self.settings.get("history", [])[:10]
-        self.favorites: List[str] = self.settings.get("favorites", [])
+        self.connect("shutdown", self.on_shutdown)
 
     def do_activate(self) -> None:
         self.window = Gtk.ApplicationWindow(application=self)
@@ -37,6 +54,8 @@ class PiperUI(Gtk.Application):
         scroll.set_child(self.text_view)
         main_box.append(scroll)
 
+        self.text_view.get_buffer().connect("changed", self._on_text_changed)
+
         key_ctrl = Gtk.EventControllerKey()
         key_ctrl.connect("key-pressed", self.on_textview_key_pressed)
         self.text_view.add_controller(key_ctrl)
@@ -52,9 +71,11 @@ class PiperUI(Gtk.Application):
         self.voice_combo = self._create_dropdown(voices, "voice")
         audio_box.append(self._labeled_row("Voice:", self.voice_combo))
 
-        sinks = list_audio_sinks()
-        display_names, self.sink_map = self._build_device_list(sinks)
-        self.device_combo = self._create_dropdown(display_names, "output_device")
+        # Sinks from the last run; refreshed once the background probe finishes
+        self.device_combo = self._create_dropdown([], "output_device")
+        self.syncing_devices = False
+        self._set_device_list(self.settings.get("cached_sinks") or ["default"])
+        self.device_combo.connect("notify::selected", self._on_device_selected)
         audio_box.append(self._labeled_row("Output:", self.device_combo))
 
         audio_box.append(Gtk.Separator(orientation=Gtk.Orientation.HORIZONTAL))
@@ -63,6 +84,11 @@ class PiperUI(Gtk.Application):
         self._add_slider(audio_box, "Noise", "noise", 0.0, 1.0, 0.05)
         self._add_slider(audio_box, "Volume", "volume", 0.0, 2.0, 0.05)
 
+        speculative_check = Gtk.CheckButton(label="Synthesize while typing")
+        speculative_check.set_active(self.settings.get("speculative", False))
+        speculative_check.connect("toggled", self.on_speculative_toggled)
+        audio_box.append(speculative_check)
+
         audio_exp.set_child(audio_box)
         main_box.append(audio_exp)
 
@@ -73,29 +99,34 @@ class PiperUI(Gtk.Application):
         hist_box.set_margin_start(16)
         hist_box.set_margin_end(16)
 
+        self.search_entry = Gtk.SearchEntry(placeholder_text="Search history and favorites")
+        self.search_entry.connect("search-changed", lambda *_: self._refresh_phrases())
+        hist_box.append(self.search_entry)
+
+        # Models hold plain strings; ListView only creates rows for what is visible
+        self.recent_model = Gtk.StringList()
+        self.fav_model = Gtk.StringList()
+
         hist_box.append(Gtk.Label(label="Recent messages", xalign=0.0))
-        self.recent_list = Gtk.ListBox()
-        self.recent_list.set_selection_mode(Gtk.SelectionMode.NONE)
-        recent_scroll = Gtk.ScrolledWindow()
-        recent_scroll.set_child(self.recent_list)
-        recent_scroll.set_max_content_height(160)
-        hist_box.append(recent_scroll)
-        self._refresh_recent()
+        hist_box.append(self._phrase_list(self.recent_model, favorite=False))
 
         hist_box.append(Gtk.Separator(orientation=Gtk.Orientation.HORIZONTAL))
 
         hist_box.append(Gtk.Label(label="Favorites", xalign=0.0))
-        self.fav_list = Gtk.ListBox()
-        self.fav_list.set_selection_mode(Gtk.SelectionMode.NONE)
-        fav_scroll = Gtk.ScrolledWindow()
-        fav_scroll.set_child(self.fav_list)
-        fav_scroll.set_max_content_height(160)
-        hist_box.append(fav_scroll)
-        self._refresh_favorites()
+        hist_box.append(self._phrase_list(self.fav_model, favorite=True))
+        self._refresh_phrases()
 
         hist_exp.set_child(hist_box)
         main_box.append(hist_exp)
 
+        status_exp = Gtk.Expander(label="Status", expanded=False)
+        self.status_label = Gtk.Label(label="No speech yet", xalign=0.0, selectable=True)
+        self.status_label.set_margin_top(12)
+        self.status_label.set_margin_start(16)
+        status_exp.set_child(self.status_label)
+        main_box.append(status_exp)
+        GLib.timeout_add_seconds(2, self._refresh_status, status_exp)
+
         btn_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=16)
         btn_box.set_halign(Gtk.Align.CENTER)
         btn_box.set_margin_top(16)
@@ -104,7 +135,10 @@ class PiperUI(Gtk.Application):
         speak_btn.connect("clicked", self.on_speak)
 
         stop_btn = Gtk.Button(label="Stop")
-        stop_btn.connect("clicked", lambda b: self.engine.stop())
+        stop_btn.connect("clicked", lambda b: self.on_stop())
+
+        read_btn = Gtk.Button(label="Read file…")
+        read_btn.connect("clicked", self.on_read_file)
 
         clear_btn = Gtk.Button(label="Clear")
         clear_btn.connect("clicked", lambda b: self.text_view.get_buffer().set_text(""))
@@ -119,14 +153,27 @@ class PiperUI(Gtk.Application):
 
         btn_box.append(speak_btn)
         btn_box.append(stop_btn)
+        btn_box.append(read_btn)
         btn_box.append(clear_btn)
         btn_box.append(self.mute_btn)
 
         main_box.append(btn_box)
 
         self.window.set_child(main_box)
+        self.window.connect("map", self._on_window_mapped)
         self.window.present()
 
+        threading.Thread(target=self._probe_audio, daemon=True).start()
+
+        self.voice_combo.connect("notify::selected", lambda *_: self._schedule_prerender())
+        self._schedule_prerender()
+
+    def on_shutdown(self, app):
+        self.reader.stop()
+        self.store.flush()
+        self.phrases.close()
+        self.engine.close()
+
     def _labeled_row(self, text: str, widget: Gtk.Widget) -> Gtk.Box:
         box = Gtk.Box(spacing=12)
         lbl = Gtk.Label(label=text, xalign=0.0)
@@ -172,6 +219,107 @@ class PiperUI(Gtk.Application):
         factory.connect("bind", bind)
         return factory
 
+    def _on_window_mapped(self, window):
+        elapsed = (time.monotonic() - self.started) * 1000
+        print(f"Window shown {elapsed:.0f} ms after start")
+
+    def _probe_audio(self):
+        registry = self.engine.sinks
+        registry.add_listener(
+            lambda added, removed: GLib.idle_add(self._on_sinks_changed, added, removed)
+        )
+        registry.start()
+        registry.ready.wait()
+        backend = self.engine.wait_backend()
+        GLib.idle_add(self._on_audio_probed, registry.names(), backend)
+
+    def _on_audio_probed(self, sinks: List[str], backend: str):
+        # Reconcile the list cached from the last run with the live one
+        added = [n for n in sinks if n not in self.sink_names]
+        removed = [n for n in self.sink_names if n not in sinks]
+        self._on_sinks_changed(added, removed)
+        self.settings["audio_backend"] = backend
+        self.store.save()
+        return False
+
+    def _on_sinks_changed(self, added: List[str], removed: List[str]):
+        model = self.device_combo.get_model()
+        self.syncing_devices = True
+        for name in removed:
+            if name in self.sink_names:
+                pos = self.sink_names.index(name)
+                model.remove(pos)
+                del self.sink_names[pos]
+                self.sink_map = {d: n for d, n in self.sink_map.items() if n != name}
+        for name in added:
+            if name and name not in self.sink_names:
+                display = self._sink_display(name)
+                self.sink_names.append(name)
+                self.sink_map[display] = name
+                model.append(display)
+        # The saved device may only now have appeared (or just gone away)
+        self._select_saved_device()
+        self.settings["cached_sinks"] = list(self.sink_names)
+        self.store.save()
+        return False
+
+    def _set_device_list(self, sinks: List[str]):
+        display_names, self.sink_map = self._build_device_list(sinks)
+        self.sink_names = [self.sink_map[d] for d in display_names]
+        model = self.device_combo.get_model()
+        self.syncing_devices = True
+        model.splice(0, model.get_n_items(), display_names)
+        self._select_saved_device()
+
+    def _select_saved_device(self):
+        """Show the saved output device, or the default sink while it is missing.
+
+        The saved choice itself is kept, so the device is reselected once
+        its sink appears.
+        """
+        saved = self.settings.get("output_device", "default")
+        self.syncing_devices = True
+        if saved in self.sink_names:
+            self.device_combo.set_selected(self.sink_names.index(saved))
+        elif "default" in self.sink_names:
+            self.device_combo.set_selected(self.sink_names.index("default"))
+        self.syncing_devices = False
+
+    def _on_device_selected(self, dropdown, _pspec):
+        if self.syncing_devices:
+            return
+        pos = dropdown.get_selected()
+        if pos != Gtk.INVALID_LIST_POSITION and pos < len(self.sink_names):
+            self.settings["output_device"] = self.sink_names[pos]
+            self.store.save()
+
+    def _sink_display(self, name: str, taken: Dict[str, str] | None = None) -> str:
+        """Friendly dropdown label for a sink, unique among ``taken`` labels."""
+        if taken is None:
+            taken = self.sink_map
+
+        display = name
+        if name == "default":
+            display = "System Default"
+        elif "analog-stereo" in name.lower():
+            display = "Analog Stereo"
+        elif "easyeffects" in name.lower():
+            display = "EasyEffects"
+        elif "virtual" in name.lower():
+            display = "Virtual Output"
+        else:
+            if '.' in name:
+                display = name.split('.')[-1].replace('_', ' ').replace('-', ' ').title()
+            if len(display) > 40:
+                display = display[:37] + "…"
+
+        base = display
+        i = 1
+        while display in taken:
+            display = f"{base} ({i})"
+            i += 1
+        return display
+
     def _build_device_list(self, sinks: List[str]) -> tuple[list[str], dict[str, str]]:
         displays = []
         mapping = {}
@@ -180,27 +328,7 @@ class PiperUI(Gtk.Application):
             if not name:
                 continue
 
-            display = name
-            if name == "default":
-                display = "System Default"
-            elif "analog-stereo" in name.lower():
-                display = "Analog Stereo"
-            elif "easyeffects" in name.lower():
-                display = "EasyEffects"
-            elif "virtual" in name.lower():
-                display = "Virtual Output"
-            else:
-                if '.' in name:
-                    display = name.split('.')[-1].replace('_', ' ').replace('-', ' ').title()
-                if len(display) > 40:
-                    display = display[:37] + "…"
-
-            base = display
-            i = 1
-            while display in mapping:
-                display = f"{base} ({i})"
-                i += 1
-
+            display = self._sink_display(name, mapping)
             displays.append(display)
             mapping[display] = name
 
@@ -233,112 +361,221 @@ class PiperUI(Gtk.Application):
             v = s.get_value()
             val_lbl.set_text(f"{v:.2f}")
             self.settings[key] = round(v, 3)
-            save_settings(self.settings)
+            self.store.save()
+            self._queue_prerender()
 
         slider.connect("value-changed", on_change)
 
-    def _refresh_recent(self):
-        while child := self.recent_list.get_first_child():
-            self.recent_list.remove(child)
+    def _refresh_status(self, expander: Gtk.Expander) -> bool:
+        if expander.get_expanded() and self.engine.metrics.utterances:
+            self.status_label.set_label(self.engine.metrics.summary())
+        return True
 
-        for text in self.history:
-            self._add_history_row(self.recent_list, text, favorite=False)
+    def _phrase_list(self, model: Gtk.StringList, favorite: bool) -> Gtk.ScrolledWindow:
+        view = Gtk.ListView(model=Gtk.NoSelection(model=model),
+                            factory=self._create_phrase_factory(favorite))
+        scroll = Gtk.ScrolledWindow()
+        scroll.set_child(view)
+        scroll.set_min_content_height(160)
+        return scroll
 
-    def _refresh_favorites(self):
-        while child := self.fav_list.get_first_child():
-            self.fav_list.remove(child)
+    def _create_phrase_factory(self, favorite: bool) -> Gtk.SignalListItemFactory:
+        factory = Gtk.SignalListItemFactory()
 
-        for text in self.favorites:
-            self._add_history_row(self.fav_list, text, favorite=True)
+        def setup(_, item):
+            box = Gtk.Box(spacing=8)
+            box.set_margin_top(4)
+            box.set_margin_bottom(4)
+            box.set_margin_start(8)
+            box.set_margin_end(8)
+
+            lbl = Gtk.Label(ellipsize=Pango.EllipsizeMode.END, xalign=0.0)
+            lbl.set_hexpand(True)
+            box.append(lbl)
+
+            # Rows are recycled, so buttons look up the text they show when clicked
+            text = lambda: item.get_item().get_string()
+            use_btn = Gtk.Button(label="Use")
+            use_btn.connect("clicked", lambda _: self.text_view.get_buffer().set_text(text()))
+            box.append(use_btn)
+
+            if not favorite:
+                star_btn = Gtk.Button(label="★")
+                star_btn.connect("clicked", lambda _: self._add_favorite(text()))
+                box.append(star_btn)
+            else:
+                del_btn = Gtk.Button(label="Delete")
+                del_btn.add_css_class("destructive-action")
+                del_btn.connect("clicked", lambda _: self._remove_favorite(text()))
+                box.append(del_btn)
 
-    def _add_history_row(self, listbox: Gtk.ListBox, text: str, favorite: bool):
-        row = Gtk.ListBoxRow()
-        box = Gtk.Box(spacing=8)
-        box.set_margin_top(4)
-        box.set_margin_bottom(4)
-        box.set_margin_start(8)
-        box.set_margin_end(8)
+            item.set_child(box)
 
-        preview = text[:70] + ("…" if len(text) > 70 else "")
-        lbl = Gtk.Label(label=preview, ellipsize=Pango.EllipsizeMode.END, xalign=0.0)
-        lbl.set_hexpand(True)
-        box.append(lbl)
+        def bind(_, item):
+            text = item.get_item().get_string()
+            preview = text[:70] + ("…" if len(text) > 70 else "")
+            item.get_child().get_first_child().set_text(preview)
 
-        use_btn = Gtk.Button(label="Use")
-        use_btn.connect("clicked", lambda _, t=text: self.text_view.get_buffer().set_text(t))
-        box.append(use_btn)
+        factory.connect("setup", setup)
+        factory.connect("bind", bind)
+        return factory
 
-        if not favorite:
-            star_btn = Gtk.Button(label="★")
-            star_btn.connect("clicked", lambda _, t=text: self._add_favorite(t))
-            box.append(star_btn)
-        else:
-            del_btn = Gtk.Button(label="Delete")
-            del_btn.add_css_class("destructive-action")
-            del_btn.connect("clicked", lambda _, t=text: self._remove_favorite(t))
-            box.append(del_btn)
+    def _refresh_phrases(self):
+        """Reload both lists from the store, filtered by the search box."""
+        query = self.search_entry.get_text()
+        for model, favorite in ((self.recent_model, False), (self.fav_model, True)):
+            model.splice(0, model.get_n_items(), self.phrases.search(query, favorite))
 
-        row.set_child(box)
-        listbox.append(row)
+    @staticmethod
+    def _find(model: Gtk.StringList, text: str) -> int | None:
+        for i in range(model.get_n_items()):
+            if model.get_string(i) == text:
+                return i
+        return None
 
     def _add_favorite(self, text: str):
-        if text and text not in self.favorites:
-            self.favorites.insert(0, text)
-            self.settings["favorites"] = self.favorites
-            save_settings(self.settings)
-            self._refresh_favorites()
+        if not text or self.phrases.is_favorite(text):
+            return
+        self.phrases.set_favorite(text, True)
+        if self.search_entry.get_text():
+            self._refresh_phrases()
+        else:
+            self.fav_model.splice(0, 0, [text])
+        self._schedule_prerender()
 
     def _remove_favorite(self, text: str):
-        if text in self.favorites:
-            self.favorites.remove(text)
-            self.settings["favorites"] = self.favorites
-            save_settings(self.settings)
-            self._refresh_favorites()
+        self.phrases.set_favorite(text, False)
+        pos = self._find(self.fav_model, text)
+        if pos is not None:
+            self.fav_model.remove(pos)
 
-    def on_speak(self, button):
+    def on_speak(self, button, priority: int = NORMAL):
         buf = self.text_view.get_buffer()
         start, end = buf.get_bounds()
         text = buf.get_text(start, end, False).strip()
         if not text:
             return
 
-        pos = self.voice_combo.get_selected()
-        voices = list_voices() or ["en_GB-cori-high"]
-        voice = voices[pos] if pos < len(voices) else voices[0]
-        self.settings["voice"] = voice
-
-        device = "default"
-        pos = self.device_combo.get_selected()
-        if pos != Gtk.INVALID_LIST_POSITION and self.sink_map:
-            display = self.device_combo.get_selected_item().get_string()
-            device = self.sink_map.get(display, "default")
-        self.settings["output_device"] = device
-
-        save_settings(self.settings)
-
-        if text in self.history:
-            self.history.remove(text)
-        self.history.insert(0, text)
-        self.history = self.history[:10]
-        self.settings["history"] = self.history
-        save_settings(self.settings)
-        self._refresh_recent()
-
-        if self.tts_thread and self.tts_thread.is_alive():
-            return
+        self._apply_selection()
+        self.store.save()
 
-        self.tts_thread = threading.Thread(
-            target=self.engine._run,
-            args=(text, self.settings),
-            daemon=True
+        self.phrases.record(text)
+        if self.search_entry.get_text():
+            self._refresh_phrases()
+        else:
+            # Move or insert the entry at the top, then drop what fell off the end
+            pos = self._find(self.recent_model, text)
+            if pos is not None:
+                self.recent_model.remove(pos)
+            self.recent_model.splice(0, 0, [text])
+            excess = self.recent_model.get_n_items() - self.phrases.depth
+            if excess > 0:
+                self.recent_model.splice(self.phrases.depth, excess, [])
+
+        self.engine.speak(text, self.settings, priority)
+
+    def _apply_selection(self):
+        """Copy the selected voice into settings.
+
+        The output device is copied as soon as it is picked, so a saved
+        device that is missing right now is not replaced by the default.
+        """
+        self.settings["voice"] = self._selected_voice()
+
+    def on_stop(self):
+        self.reader.stop()
+        self.engine.stop()
+
+    def on_read_file(self, button):
+        self.file_dialog = Gtk.FileChooserNative(
+            title="Read file aloud", transient_for=self.window,
+            action=Gtk.FileChooserAction.OPEN,
         )
-        self.tts_thread.start()
+        self.file_dialog.connect("response", self._on_read_file_chosen)
+        self.file_dialog.show()
+
+    def _on_read_file_chosen(self, dialog, response):
+        self.file_dialog = None
+        if response != Gtk.ResponseType.ACCEPT:
+            return
+        path = dialog.get_file().get_path()
+
+        # Continue where the last reading of this file stopped
+        saved = self.settings.get("reader") or {}
+        offset = saved.get("offset", 0) if saved.get("path") == path else 0
+        try:
+            if offset > os.path.getsize(path):
+                offset = 0
+        except OSError as e:
+            print(f"Cannot read {path}: {e}")
+            return
+        if offset:
+            print(f"Resuming {path} at byte {offset}")
+
+        self._apply_selection()
+        self.store.save()
+        self.reader.start(path, self.settings, offset,
+                          lambda p, o: GLib.idle_add(self._on_reader_progress, p, o))
+
+    def _on_reader_progress(self, path: str, offset: int | None) -> bool:
+        # None means the whole file was read; start over next time
+        self.settings["reader"] = {"path": path, "offset": offset or 0}
+        self.store.save()
+        return False
+
+    def _selected_voice(self) -> str:
+        item = self.voice_combo.get_selected_item()
+        name = item.get_string() if item else ""
+        return name if self.engine.catalog.get(name) else "en_GB-cori-high"
+
+    def _schedule_prerender(self):
+        """Pre-synthesize favorites and recent history for the current settings."""
+        texts = (self.phrases.favorites(self.settings.get("prerender_favorites", 50))
+                 + self.phrases.history(self.settings.get("prerender_history", 3)))
+        settings = {**self.settings, "voice": self._selected_voice()}
+        self.engine.prerender.schedule(texts, settings)
+
+    def _queue_prerender(self):
+        """Reschedule pre-rendering once a slider has stopped moving."""
+        if self.prerender_source is not None:
+            GLib.source_remove(self.prerender_source)
+        self.prerender_source = GLib.timeout_add(PRERENDER_DELAY_MS, self._on_prerender_timeout)
+
+    def _on_prerender_timeout(self) -> bool:
+        self.prerender_source = None
+        self._schedule_prerender()
+        return False
+
+    def _on_text_changed(self, buf: Gtk.TextBuffer):
+        if self.speculate_source is not None:
+            GLib.source_remove(self.speculate_source)
+            self.speculate_source = None
+        if self.settings.get("speculative", False):
+            self.speculate_source = GLib.timeout_add(SPECULATE_DELAY_MS, self._speculate)
+
+    def _speculate(self) -> bool:
+        """Render the text typed so far in the background, ready for Speak."""
+        self.speculate_source = None
+        buf = self.text_view.get_buffer()
+        start, end = buf.get_bounds()
+        text = buf.get_text(start, end, False).strip()
+        settings = {**self.settings, "voice": self._selected_voice()}
+        self.engine.prerender.speculate(text, settings)
+        return False
+
+    def on_speculative_toggled(self, button: Gtk.CheckButton):
+        self.settings["speculative"] = button.get_active()
+        self.store.save()
+        if button.get_active():
+            self._on_text_changed(self.text_view.get_buffer())
+        else:
+            self.engine.prerender.speculate("", self.settings)
 
     def on_mute_toggled(self, button: Gtk.ToggleButton):
         muted = button.get_active()
         self.engine.set_mute(muted)
         self.settings["mute"] = muted
-        save_settings(self.settings)
+        self.store.save()
 
         if muted:
             button.set_label("Unmute")
@@ -351,7 +588,9 @@ class PiperUI(Gtk.Application):
         if keyval == Gdk.KEY_Return:
             if state & Gdk.ModifierType.SHIFT_MASK:
                 return False
-            self.on_speak(None)
+            # Ctrl+Return interrupts whatever is playing instead of queueing
+            priority = INTERRUPT if state & Gdk.ModifierType.CONTROL_MASK else NORMAL
+            self.on_speak(None, priority)
             return True
         return False
 
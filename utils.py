@@ -1,5 +1,11 @@
+import io
 import subprocess
 import os
+import struct
+import tempfile
+import wave
+
+from catalog import get_catalog
 
 
 def get_voice_dir():
@@ -8,25 +14,71 @@ def get_voice_dir():
 
 
 def list_voices(voice_dir=None):
-    if voice_dir is None:
-        voice_dir = get_voice_dir()
-    if not os.path.exists(voice_dir):
-        return []
-    return [
-        f.replace(".onnx", "")
-        for f in os.listdir(voice_dir)
-        if f.endswith(".onnx")
-    ]
-
-
-def list_audio_sinks():
-    sinks = ["default"]
+    """Voice names in the voices folder, from the shared cached catalog."""
+    return get_catalog(voice_dir or get_voice_dir()).names()
+
+
+def read_wav(path):
+    """Return (pcm, sample rate) of a 16-bit mono WAV file."""
+    with open(path, "rb") as f:
+        return parse_wav(f.read())
+
+
+def parse_wav(data: bytes) -> tuple[memoryview, int]:
+    """Split a 16-bit mono WAV held in memory into (pcm view, sample rate).
+
+    The PCM is a memoryview into ``data``, so nothing is copied. Headers
+    this does not understand are handed to the wave module instead.
+    """
+    view = memoryview(data)
+    rate = None
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        pos = 12
+        while pos + 8 <= len(data):
+            chunk_id = data[pos:pos + 4]
+            size, = struct.unpack_from("<I", data, pos + 4)
+            body = pos + 8
+            if chunk_id == b"fmt ":
+                fmt, channels, rate = struct.unpack_from("<HHI", data, body)
+                bits, = struct.unpack_from("<H", data, body + 14)
+                if (fmt, channels, bits) != (1, 1, 16):
+                    break
+            elif chunk_id == b"data" and rate is not None:
+                # Streamed WAVs may carry a placeholder size; trust the buffer
+                end = min(body + size, len(data))
+                return view[body:end - (end - body) % 2], rate
+            pos = body + size + size % 2
+
+    with wave.open(io.BytesIO(data), "rb") as w:
+        return memoryview(w.readframes(w.getnframes())), w.getframerate()
+
+
+def write_wav(path, pcm, rate):
+    """Atomically write 16-bit mono PCM as a WAV file."""
+    # A unique temp name, so concurrent writers of one path cannot collide
+    fd, tmp = tempfile.mkstemp(prefix=".", suffix=".part", dir=os.path.dirname(path) or ".")
     try:
-        out = subprocess.check_output(["pactl", "list", "short", "sinks"], text=True)
-        for line in out.strip().splitlines():
-            parts = line.split("\t")
-            if len(parts) >= 2:
-                sinks.append(parts[1])
-    except Exception as e:
-        print("Failed to list sinks:", e)
+        os.fchmod(fd, 0o644)   # mkstemp creates the file private
+        with os.fdopen(fd, "wb") as f, wave.open(f, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes(pcm)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def list_sinks_by_index() -> dict[int, str]:
+    """Map of sink index to sink name from `pactl list short sinks`."""
+    sinks = {}
+    out = subprocess.check_output(["pactl", "list", "short", "sinks"], text=True, timeout=5)
+    for line in out.strip().splitlines():
+        parts = line.split("\t")
+        if len(parts) >= 2 and parts[0].isdigit():
+            sinks[int(parts[0])] = parts[1]
     return sinks